@@ -0,0 +1,526 @@
+/*
+ * Native implementation of the fit and fit_score primitives of xsystem.
+ *
+ * The functions mirror the methods of xsystem.ScoringBackend with the same names, and must return the same
+ * results: see tests/backend_test.py. The AsciiClass members and the ancestors of every class are provided by
+ * xsystem.NativeBackend through configure().
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+static PyObject *class_digit = NULL;
+static PyObject *class_lower = NULL;
+static PyObject *class_upper = NULL;
+static PyObject *class_alpha = NULL;
+static PyObject *class_space = NULL;
+static PyObject *class_punct = NULL;
+
+/* dict: AsciiClass -> frozenset of its ancestors, including itself */
+static PyObject *class_ancestors = NULL;
+
+static PyObject *str_a_class = NULL;
+static PyObject *str_chars = NULL;
+static PyObject *str_is_class = NULL;
+static PyObject *str_symbols = NULL;
+static PyObject *str_tokens = NULL;
+
+static int
+check_configured(void)
+{
+    if (class_ancestors == NULL) {
+        PyErr_SetString(PyExc_RuntimeError, "_xsystem_speedups is not configured");
+        return -1;
+    }
+    return 0;
+}
+
+/* Mirror of AsciiClass.get_ascii_class for a single character, returns a borrowed reference */
+static PyObject *
+ascii_class(Py_UCS4 c, PyObject *s)
+{
+    if (Py_UNICODE_ISDIGIT(c)) {
+        return class_digit;
+    }
+    if (Py_UNICODE_ISALPHA(c)) {
+        if (Py_UNICODE_ISLOWER(c)) {
+            return class_lower;
+        }
+        if (Py_UNICODE_ISUPPER(c)) {
+            return class_upper;
+        }
+        return class_alpha;
+    }
+    if (Py_UNICODE_ISSPACE(c)) {
+        return class_space;
+    }
+    if (Py_UNICODE_ISPRINTABLE(c)) {
+        return class_punct;
+    }
+
+    PyErr_Format(PyExc_ValueError, "%U unknown", s);
+    return NULL;
+}
+
+static int
+symbol_fit_score_impl(PyObject *symbol, PyObject *char_class, PyObject *s, double alpha, double *score)
+{
+    PyObject *a_class = PyObject_GetAttr(symbol, str_a_class);
+    if (a_class == NULL) {
+        return -1;
+    }
+    Py_DECREF(a_class);
+
+    if (a_class == char_class) {
+        *score = 0;
+        return 0;
+    }
+
+    PyObject *is_class_obj = PyObject_GetAttr(symbol, str_is_class);
+    if (is_class_obj == NULL) {
+        return -1;
+    }
+    int is_class = PyObject_IsTrue(is_class_obj);
+    Py_DECREF(is_class_obj);
+    if (is_class < 0) {
+        return -1;
+    }
+
+    if (!is_class) {
+        PyObject *chars = PyObject_GetAttr(symbol, str_chars);
+        if (chars == NULL) {
+            return -1;
+        }
+        int contains = PySequence_Contains(chars, s);
+        Py_DECREF(chars);
+        if (contains < 0) {
+            return -1;
+        }
+        if (contains) {
+            *score = alpha;
+            return 0;
+        }
+    }
+
+    *score = 1;
+    return 0;
+}
+
+static PyObject *
+symbol_fit_score(PyObject *module, PyObject *args)
+{
+    PyObject *symbol, *s;
+    double alpha;
+
+    if (!PyArg_ParseTuple(args, "OUd:symbol_fit_score", &symbol, &s, &alpha) || check_configured() < 0) {
+        return NULL;
+    }
+
+    Py_ssize_t length = PyUnicode_GET_LENGTH(s);
+
+    if (length > 1) {
+        PyErr_SetString(PyExc_ValueError, "Expected single character");
+        return NULL;
+    }
+
+    /* The empty string is printable, hence punctuation, as in AsciiClass.get_ascii_class */
+    PyObject *char_class = length == 0 ? class_punct : ascii_class(PyUnicode_READ_CHAR(s, 0), s);
+    if (char_class == NULL) {
+        return NULL;
+    }
+
+    double score;
+    if (symbol_fit_score_impl(symbol, char_class, s, alpha, &score) < 0) {
+        return NULL;
+    }
+
+    return PyFloat_FromDouble(score);
+}
+
+static int
+token_fit_score_impl(PyObject *token, PyObject *t, double alpha, double *score)
+{
+    PyObject *symbols_obj = PyObject_GetAttr(token, str_symbols);
+    if (symbols_obj == NULL) {
+        return -1;
+    }
+    PyObject *symbols = PySequence_Fast(symbols_obj, "symbols must be a sequence");
+    Py_DECREF(symbols_obj);
+    if (symbols == NULL) {
+        return -1;
+    }
+
+    Py_ssize_t n_symbols = PySequence_Fast_GET_SIZE(symbols);
+    Py_ssize_t length = PyUnicode_GET_LENGTH(t);
+    Py_ssize_t n = n_symbols < length ? n_symbols : length;
+
+    double total = 0;
+
+    for (Py_ssize_t i = 0; i < n; i++) {
+        Py_UCS4 c = PyUnicode_READ_CHAR(t, i);
+        PyObject *s = PyUnicode_FromOrdinal(c);
+        if (s == NULL) {
+            Py_DECREF(symbols);
+            return -1;
+        }
+
+        PyObject *char_class = ascii_class(c, s);
+        double symbol_score;
+
+        if (char_class == NULL
+                || symbol_fit_score_impl(PySequence_Fast_GET_ITEM(symbols, i), char_class, s, alpha, &symbol_score) < 0) {
+            Py_DECREF(s);
+            Py_DECREF(symbols);
+            return -1;
+        }
+        Py_DECREF(s);
+
+        total += symbol_score;
+    }
+
+    Py_DECREF(symbols);
+
+    *score = total + (double)(length > n_symbols ? length - n_symbols : n_symbols - length);
+    return 0;
+}
+
+static PyObject *
+token_fit_score(PyObject *module, PyObject *args)
+{
+    PyObject *token, *t;
+    double alpha;
+
+    if (!PyArg_ParseTuple(args, "OUd:token_fit_score", &token, &t, &alpha) || check_configured() < 0) {
+        return NULL;
+    }
+
+    double score;
+    if (token_fit_score_impl(token, t, alpha, &score) < 0) {
+        return NULL;
+    }
+
+    return PyFloat_FromDouble(score);
+}
+
+/* Returns 1 if ancestor is an ancestor of, or the same as, a_class */
+static int
+is_ancestor(PyObject *ancestor, PyObject *a_class)
+{
+    PyObject *ancestors = PyDict_GetItemWithError(class_ancestors, a_class);
+    if (ancestors == NULL) {
+        if (!PyErr_Occurred()) {
+            PyErr_Format(PyExc_ValueError, "Unknown ASCII class %R", a_class);
+        }
+        return -1;
+    }
+    return PySequence_Contains(ancestors, ancestor);
+}
+
+static int
+symbol_fit_impl(PyObject *symbol, PyObject *other, double *score)
+{
+    int result = -1;
+    PyObject *a_class = NULL, *other_class = NULL, *chars = NULL, *other_chars = NULL, *iterator = NULL, *item;
+
+    a_class = PyObject_GetAttr(symbol, str_a_class);
+    other_class = PyObject_GetAttr(other, str_a_class);
+    if (a_class == NULL || other_class == NULL) {
+        goto done;
+    }
+
+    if (a_class == other_class) {
+        *score = 0;
+        result = 0;
+        goto done;
+    }
+
+    int related = is_ancestor(other_class, a_class);
+    if (related == 0) {
+        related = is_ancestor(a_class, other_class);
+    }
+    if (related < 0) {
+        goto done;
+    }
+    if (related) {
+        *score = 0;
+        result = 0;
+        goto done;
+    }
+
+    chars = PyObject_GetAttr(symbol, str_chars);
+    other_chars = PyObject_GetAttr(other, str_chars);
+    if (chars == NULL || other_chars == NULL) {
+        goto done;
+    }
+
+    Py_ssize_t n_chars = PyObject_Size(chars);
+    if (n_chars < 0) {
+        goto done;
+    }
+
+    iterator = PyObject_GetIter(chars);
+    if (iterator == NULL) {
+        goto done;
+    }
+
+    Py_ssize_t common = 0;
+
+    while ((item = PyIter_Next(iterator)) != NULL) {
+        int contains = PySequence_Contains(other_chars, item);
+        Py_DECREF(item);
+        if (contains < 0) {
+            goto done;
+        }
+        common += contains;
+    }
+    if (PyErr_Occurred()) {
+        goto done;
+    }
+
+    *score = common != 0 ? 1 - (double)common / (double)n_chars : 1;
+    result = 0;
+
+done:
+    Py_XDECREF(a_class);
+    Py_XDECREF(other_class);
+    Py_XDECREF(chars);
+    Py_XDECREF(other_chars);
+    Py_XDECREF(iterator);
+    return result;
+}
+
+static PyObject *
+symbol_fit(PyObject *module, PyObject *args)
+{
+    PyObject *symbol, *other;
+
+    if (!PyArg_ParseTuple(args, "OO:symbol_fit", &symbol, &other) || check_configured() < 0) {
+        return NULL;
+    }
+
+    double score;
+    if (symbol_fit_impl(symbol, other, &score) < 0) {
+        return NULL;
+    }
+
+    return PyFloat_FromDouble(score);
+}
+
+/* Sum of fit over the pairs of items of the attribute of a and b, plus the difference of their lengths */
+static int
+pairwise_fit(PyObject *a, PyObject *b, PyObject *attribute, int (*fit)(PyObject *, PyObject *, double *), double *score)
+{
+    int result = -1;
+    PyObject *items = NULL, *other_items = NULL, *sequence = NULL, *other_sequence = NULL;
+
+    items = PyObject_GetAttr(a, attribute);
+    other_items = PyObject_GetAttr(b, attribute);
+    if (items == NULL || other_items == NULL) {
+        goto done;
+    }
+
+    sequence = PySequence_Fast(items, "expected a sequence");
+    other_sequence = PySequence_Fast(other_items, "expected a sequence");
+    if (sequence == NULL || other_sequence == NULL) {
+        goto done;
+    }
+
+    Py_ssize_t length = PySequence_Fast_GET_SIZE(sequence);
+    Py_ssize_t other_length = PySequence_Fast_GET_SIZE(other_sequence);
+    Py_ssize_t n = length < other_length ? length : other_length;
+
+    double total = 0;
+
+    for (Py_ssize_t i = 0; i < n; i++) {
+        double item_score;
+
+        if (fit(PySequence_Fast_GET_ITEM(sequence, i), PySequence_Fast_GET_ITEM(other_sequence, i), &item_score) < 0) {
+            goto done;
+        }
+
+        total += item_score;
+    }
+
+    *score = total + (double)(length > other_length ? length - other_length : other_length - length);
+    result = 0;
+
+done:
+    Py_XDECREF(items);
+    Py_XDECREF(other_items);
+    Py_XDECREF(sequence);
+    Py_XDECREF(other_sequence);
+    return result;
+}
+
+static int
+token_fit_impl(PyObject *token, PyObject *other, double *score)
+{
+    return pairwise_fit(token, other, str_symbols, symbol_fit_impl, score);
+}
+
+static PyObject *
+token_fit(PyObject *module, PyObject *args)
+{
+    PyObject *token, *other;
+
+    if (!PyArg_ParseTuple(args, "OO:token_fit", &token, &other) || check_configured() < 0) {
+        return NULL;
+    }
+
+    double score;
+    if (token_fit_impl(token, other, &score) < 0) {
+        return NULL;
+    }
+
+    return PyFloat_FromDouble(score);
+}
+
+static PyObject *
+branch_fit(PyObject *module, PyObject *args)
+{
+    PyObject *branch, *other;
+
+    if (!PyArg_ParseTuple(args, "OO:branch_fit", &branch, &other) || check_configured() < 0) {
+        return NULL;
+    }
+
+    double score;
+    if (pairwise_fit(branch, other, str_tokens, token_fit_impl, &score) < 0) {
+        return NULL;
+    }
+
+    return PyFloat_FromDouble(score);
+}
+
+/* Mirror of Branch.fit_score given the tokens of the tuple: tokens past the end of the branch score their length */
+static PyObject *
+branch_fit_score(PyObject *module, PyObject *args)
+{
+    PyObject *branch, *tuple_tokens, *tokens_obj, *tokens;
+    Py_ssize_t length;
+    double alpha;
+
+    if (!PyArg_ParseTuple(args, "OO!nd:branch_fit_score", &branch, &PyTuple_Type, &tuple_tokens, &length, &alpha)
+            || check_configured() < 0) {
+        return NULL;
+    }
+
+    tokens_obj = PyObject_GetAttr(branch, str_tokens);
+    if (tokens_obj == NULL) {
+        return NULL;
+    }
+    tokens = PySequence_Fast(tokens_obj, "tokens must be a sequence");
+    Py_DECREF(tokens_obj);
+    if (tokens == NULL) {
+        return NULL;
+    }
+
+    Py_ssize_t n_tokens = PySequence_Fast_GET_SIZE(tokens);
+    Py_ssize_t n = PyTuple_GET_SIZE(tuple_tokens);
+    if (n > length) {
+        n = length;
+    }
+
+    double total = 0;
+
+    for (Py_ssize_t i = 0; i < n; i++) {
+        PyObject *t = PyTuple_GET_ITEM(tuple_tokens, i);
+
+        if (!PyUnicode_Check(t)) {
+            Py_DECREF(tokens);
+            PyErr_SetString(PyExc_TypeError, "tokens of the tuple must be strings");
+            return NULL;
+        }
+
+        if (i < n_tokens) {
+            double token_score;
+
+            if (token_fit_score_impl(PySequence_Fast_GET_ITEM(tokens, i), t, alpha, &token_score) < 0) {
+                Py_DECREF(tokens);
+                return NULL;
+            }
+
+            total += token_score;
+        } else {
+            total += (double)PyUnicode_GET_LENGTH(t);
+        }
+    }
+
+    Py_DECREF(tokens);
+
+    return PyFloat_FromDouble(total);
+}
+
+static PyObject *
+configure(PyObject *module, PyObject *args)
+{
+    PyObject *digit, *lower, *upper, *alpha, *space, *punct, *ancestors;
+
+    if (!PyArg_ParseTuple(args, "OOOOOOO!:configure", &digit, &lower, &upper, &alpha, &space, &punct,
+                          &PyDict_Type, &ancestors)) {
+        return NULL;
+    }
+
+    Py_INCREF(digit);
+    Py_XSETREF(class_digit, digit);
+    Py_INCREF(lower);
+    Py_XSETREF(class_lower, lower);
+    Py_INCREF(upper);
+    Py_XSETREF(class_upper, upper);
+    Py_INCREF(alpha);
+    Py_XSETREF(class_alpha, alpha);
+    Py_INCREF(space);
+    Py_XSETREF(class_space, space);
+    Py_INCREF(punct);
+    Py_XSETREF(class_punct, punct);
+    Py_INCREF(ancestors);
+    Py_XSETREF(class_ancestors, ancestors);
+
+    Py_RETURN_NONE;
+}
+
+static PyMethodDef speedups_methods[] = {
+    {"configure", configure, METH_VARARGS,
+     "configure(digit, lower, upper, alpha, space, punct, ancestors)\n\nSet the AsciiClass members and their ancestors."},
+    {"symbol_fit_score", symbol_fit_score, METH_VARARGS, "symbol_fit_score(symbol, s, alpha) -> float"},
+    {"symbol_fit", symbol_fit, METH_VARARGS, "symbol_fit(symbol, other) -> float"},
+    {"token_fit_score", token_fit_score, METH_VARARGS, "token_fit_score(token, t, alpha) -> float"},
+    {"token_fit", token_fit, METH_VARARGS, "token_fit(token, other) -> float"},
+    {"branch_fit_score", branch_fit_score, METH_VARARGS,
+     "branch_fit_score(branch, tuple_tokens, length, alpha) -> float\n\nScore of a tuple of length characters split in tuple_tokens."},
+    {"branch_fit", branch_fit, METH_VARARGS, "branch_fit(branch, other) -> float"},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef speedups_module = {
+    PyModuleDef_HEAD_INIT,
+    "_xsystem_speedups",
+    "Native implementation of the fit and fit_score primitives of xsystem.",
+    -1,
+    speedups_methods
+};
+
+PyMODINIT_FUNC
+PyInit__xsystem_speedups(void)
+{
+    str_a_class = PyUnicode_InternFromString("a_class");
+    str_chars = PyUnicode_InternFromString("chars");
+    str_is_class = PyUnicode_InternFromString("is_class");
+    str_symbols = PyUnicode_InternFromString("symbols");
+    str_tokens = PyUnicode_InternFromString("tokens");
+
+    if (str_a_class == NULL || str_chars == NULL || str_is_class == NULL || str_symbols == NULL || str_tokens == NULL) {
+        return NULL;
+    }
+
+    PyObject *module = PyModule_Create(&speedups_module);
+
+#ifdef Py_GIL_DISABLED
+    /* The primitives only read their arguments and the classes set once by configure() */
+    if (module != NULL && PyUnstable_Module_SetGIL(module, Py_MOD_GIL_NOT_USED) < 0) {
+        Py_DECREF(module);
+        return NULL;
+    }
+#endif
+
+    return module;
+}
@@ -0,0 +1,61 @@
+"""Compare the matching speed of the raw and optimised patterns on the learning data.
+
+Usage: python benchmarks/matching_benchmark.py [--rows N] [--repeat R]
+"""
+from __future__ import annotations
+
+from argparse import ArgumentParser
+import os
+import random
+import re
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+from conftest import word_generators  # noqa: E402
+from xsystem import XTructure  # noqa: E402
+
+
+def datasets(rows: int, rnd: random.Random) -> dict[str, list[str]]:
+    generators = word_generators(rnd)
+
+    return {name: [generators[name]() for _ in range(rows)] for name in ("dates", "ssn", "codes", "amounts")}
+
+
+def main() -> int:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000, help="Number of rows per dataset, defaults to 10000")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed repetitions, defaults to 5")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the data generator, defaults to 0")
+    cmd = parser.parse_args()
+
+    print(f"{'dataset':<10} {'raw (ms)':>10} {'optimised (ms)':>15} {'speedup':>8} {'raw matches':>12} {'opt matches':>12}")
+
+    for name, data in datasets(cmd.rows, random.Random(cmd.seed)).items():
+        x = XTructure()
+
+        for word in data:
+            x.learn_new_word(word)
+
+        raw = re.compile("^(?:" + str(x) + ")$")
+        optimised = re.compile(x.to_regex())
+
+        raw_time = min(timeit.repeat(lambda: [raw.match(word) for word in data], number=1, repeat=cmd.repeat))
+        optimised_time = min(timeit.repeat(lambda: [optimised.match(word) for word in data], number=1, repeat=cmd.repeat))
+
+        raw_matches = sum(1 for word in data if raw.match(word))
+        optimised_matches = sum(1 for word in data if optimised.match(word))
+
+        print(
+            f"{name:<10} {raw_time * 1000:>10.2f} {optimised_time * 1000:>15.2f} {raw_time / optimised_time:>7.2f}x "
+            f"{raw_matches:>12} {optimised_matches:>12}"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,15 @@
 from __future__ import annotations
 
+from setuptools import Extension  # type: ignore
 from setuptools import setup  # type: ignore
 from pathlib import Path
 this_directory = Path(__file__).parent
 long_description = (this_directory / "README.md").read_text()
 
-setup(long_description=long_description)
+setup(
+    long_description=long_description,
+    # Optional accelerated backend, xsystem falls back to pure Python if it cannot be built
+    ext_modules=[
+        Extension("_xsystem_speedups", sources=["_xsystem_speedups.c"], optional=True),
+    ],
+)
@@ -0,0 +1,176 @@
+import os
+import random
+import string
+import subprocess
+import sys
+
+import pytest
+
+import xsystem
+from xsystem import AsciiClass
+from xsystem import Branch
+from xsystem import InternedToken
+from xsystem import ScoringBackend
+from xsystem import Symbol
+from xsystem import Token
+from xsystem import XTructure
+from xsystem import get_backend
+from xsystem import set_backend
+
+ALPHABET = string.ascii_letters + string.digits + string.punctuation + " \t" + "àÈ"
+
+
+@pytest.fixture
+def native():
+    pytest.importorskip("_xsystem_speedups")
+
+    return xsystem.create_backend("native")
+
+
+@pytest.fixture
+def reference():
+    return ScoringBackend()
+
+
+@pytest.fixture(autouse=True)
+def restore_backend():
+    backend = get_backend()
+    yield
+    set_backend(backend)
+
+
+def _random_symbol(rnd: random.Random) -> Symbol:
+    kind = rnd.random()
+
+    if kind < 0.1:
+        return Symbol(rnd.choice([c for c in AsciiClass if c != AsciiClass.CNTRL]), xsystem._NO_CHARS, True)
+
+    symbol = Symbol.build(rnd.choice(ALPHABET))
+
+    for _ in range(rnd.randint(0, 4)):
+        symbol = symbol.merge(Symbol.build(rnd.choice(ALPHABET)))
+
+    return symbol.as_optional() if kind > 0.9 else symbol
+
+
+def _random_word(rnd: random.Random) -> str:
+    return "".join(rnd.choice(ALPHABET + "--//") for _ in range(rnd.randint(0, 12)))
+
+
+def _random_branch(rnd: random.Random) -> Branch:
+    branch = Branch.build(_random_word(rnd) or "x")
+
+    for _ in range(rnd.randint(0, 3)):
+        branch = branch.merge(Branch.build(_random_word(rnd) or "y"))
+
+    return branch
+
+
+def test_symbol_primitives_are_equivalent(reference, native):
+    rnd = random.Random(0)
+
+    for _ in range(2000):
+        symbol = _random_symbol(rnd)
+        other = _random_symbol(rnd)
+        c = rnd.choice(ALPHABET)
+        alpha = rnd.choice([0, 0.2, 1 / 3])
+
+        assert native.symbol_fit_score(symbol, c, alpha) == reference.symbol_fit_score(symbol, c, alpha)
+        assert native.symbol_fit(symbol, other) == reference.symbol_fit(symbol, other)
+
+
+def test_symbol_fit_score_errors_are_equivalent(reference, native):
+    symbol = Symbol.build("a")
+
+    assert native.symbol_fit_score(symbol, "", 0.2) == reference.symbol_fit_score(symbol, "", 0.2)
+
+    for backend in [reference, native]:
+        with pytest.raises(ValueError):
+            backend.symbol_fit_score(symbol, "ab", 0.2)
+
+        with pytest.raises(ValueError):
+            backend.symbol_fit_score(symbol, "\x00", 0.2)
+
+
+def test_token_primitives_are_equivalent(reference, native):
+    rnd = random.Random(1)
+
+    for _ in range(1000):
+        token = Token([_random_symbol(rnd) for _ in range(rnd.randint(0, 6))])
+        other = Token([_random_symbol(rnd) for _ in range(rnd.randint(0, 6))])
+        t = "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(0, 8)))
+
+        assert native.token_fit_score(token, t, 0.2) == reference.token_fit_score(token, t, 0.2)
+        assert native.token_fit(token, other) == reference.token_fit(token, other)
+
+        interned, other_interned = InternedToken.intern(token), InternedToken.intern(other)
+
+        assert native.token_fit(interned, other_interned) == reference.token_fit(token, other)
+
+
+def test_branch_primitives_are_equivalent(reference, native):
+    rnd = random.Random(2)
+
+    for _ in range(1000):
+        branch = _random_branch(rnd)
+        other = _random_branch(rnd)
+        t = _random_word(rnd)
+
+        assert native.branch_fit_score(branch, t, 0.2) == reference.branch_fit_score(branch, t, 0.2)
+        assert native.branch_fit(branch, other) == reference.branch_fit(branch, other)
+
+
+def test_long_tokens_score_the_same(reference, native):
+    rnd = random.Random(4)
+    symbol = Symbol.build("a").merge(Symbol.build("B"))
+
+    for _ in range(200):
+        token = Token([symbol] * rnd.randint(20, 60))
+        t = "".join(rnd.choice("aBa1") for _ in range(rnd.randint(20, 60)))
+        branch = Branch([token, Token([symbol] * rnd.randint(20, 60))])
+
+        assert native.token_fit_score(token, t, 1 / 3) == reference.token_fit_score(token, t, 1 / 3)
+        assert native.branch_fit_score(branch, t + "-" + t, 1 / 3) == reference.branch_fit_score(branch, t + "-" + t, 1 / 3)
+
+
+@pytest.mark.parametrize("interned", [False, True])
+def test_learnt_structure_is_independent_of_backend(native, interned):
+    rnd = random.Random(3)
+    dataset = [_random_word(rnd) for _ in range(300)] + [f"{rnd.randint(1, 28):02d}-{rnd.randint(1, 12):02d}" for _ in range(300)]
+
+    patterns = []
+
+    for backend in ["python", "native"]:
+        set_backend(backend)
+
+        x = XTructure(max_branches=4, interned=interned)
+        all(map(x.learn_new_word, dataset))
+
+        patterns.append(str(x))
+
+    assert patterns[0] == patterns[1]
+
+
+def test_set_backend():
+    set_backend("python")
+
+    assert type(get_backend()) is ScoringBackend
+    assert Symbol.build("1").fit_score("2", 0.2) == 0
+
+    with pytest.raises(ValueError):
+        set_backend("fortran")
+
+
+def test_backend_from_environment():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    output = subprocess.run(
+        [sys.executable, "-c", "import xsystem; print(xsystem.get_backend().name)"],
+        cwd=root,
+        env=dict(os.environ, XSYSTEM_BACKEND="python"),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+    assert output.strip() == "python"
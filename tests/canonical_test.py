@@ -0,0 +1,134 @@
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+from xsystem import XTructure
+
+
+def _learn(words, **kwargs) -> XTructure:
+    x = XTructure(canonical=True, **kwargs)
+
+    for word in words:
+        x.learn_new_word(word)
+
+    return x
+
+
+def test_canonical_is_order_insensitive(mixed_words):
+    dataset = mixed_words(500, 7)
+
+    expected = str(_learn(dataset, max_branches=3))
+
+    rnd = random.Random(0)
+
+    for _ in range(5):
+        shuffled = list(dataset)
+        rnd.shuffle(shuffled)
+
+        assert str(_learn(shuffled, max_branches=3)) == expected
+
+
+def test_canonical_is_partition_insensitive(mixed_words):
+    dataset = mixed_words(500, 7)
+
+    expected = str(_learn(dataset, max_branches=3))
+
+    rnd = random.Random(1)
+
+    for parts in [2, 3, 10]:
+        shuffled = list(dataset)
+        rnd.shuffle(shuffled)
+
+        partials = [_learn(shuffled[i::parts], max_branches=3) for i in range(parts)]
+
+        x = partials[0].spawn()
+
+        for partial in reversed(partials):
+            x.update(partial)
+
+        assert str(x) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 13, 1000])
+def test_canonical_threaded_matches_sequential(chunk_size, mixed_words):
+    dataset = mixed_words(300, 7)
+
+    x = XTructure(canonical=True, max_branches=3)
+    x.learn_threaded(dataset, workers=4, chunk_size=chunk_size)
+
+    assert str(x) == str(_learn(dataset, max_branches=3))
+
+
+def test_canonical_respects_max_branches(mixed_words):
+    x = _learn(mixed_words(300, 7), max_branches=2)
+
+    x.flush()
+
+    assert 0 < len(x.branches) <= 2
+
+
+def test_canonical_pattern_matches_input():
+    dataset = [f"{d:02d}-{m:02d}-{y}" for d in range(1, 29, 3) for m in range(1, 13) for y in (1999, 2023)]
+
+    x = _learn(dataset)
+
+    assert x.fit_score(dataset[0]) == 0
+    assert str(x)
+
+
+def test_canonical_update_requires_canonical():
+    x = XTructure(canonical=True)
+
+    with pytest.raises(ValueError):
+        x.update(XTructure())
+
+
+def test_canonical_rejects_memory_budget():
+    with pytest.raises(ValueError):
+        XTructure(canonical=True, memory_budget=1024)
+
+
+@pytest.mark.parametrize("branch_slack", [0.0, 1.0])
+def test_canonical_incremental_flush_matches_full_flush(branch_slack, mixed_words):
+    dataset = mixed_words(400, 7)
+    rnd = random.Random(1)
+    dataset += ["".join(rnd.choice("ab1-. ") for _ in range(rnd.randint(1, 8))) for _ in range(200)]
+
+    x = XTructure(canonical=True, max_branches=4, branch_slack=branch_slack)
+
+    for i, word in enumerate(dataset):
+        x.learn_new_word(word)
+
+        if i % 7 == 0:
+            x.flush()
+
+    assert str(x) == str(_learn(dataset, max_branches=4, branch_slack=branch_slack))
+
+
+def test_canonical_is_stable_across_hash_seeds():
+    script = (
+        "from xsystem import XTructure\n"
+        "x = XTructure(canonical=True, max_branches=2)\n"
+        "for w in ['ab-1', 'cd-2', 'ef-3', 'XY', 'x.1', 'qz']:\n"
+        "    x.learn_new_word(w)\n"
+        "print(x)\n"
+    )
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    outputs = {
+        subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=root,
+            env=dict(os.environ, PYTHONHASHSEED=str(seed)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        for seed in range(4)
+    }
+
+    assert len(outputs) == 1
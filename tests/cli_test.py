@@ -0,0 +1,187 @@
+import io
+import re
+import json
+import random
+
+import pytest
+
+from xsystem import ProgressReporter
+from xsystem import XTructure
+from xsystem import learn
+from xsystem import main
+
+
+def _write_input(tmp_path, lines):
+    path = tmp_path / "input.txt"
+    path.write_text("".join(f"{line}\n" for line in lines))
+    return path
+
+
+def test_main_writes_pattern(tmp_path):
+    dataset = [f"{i:04d}" for i in range(100)]
+    source = _write_input(tmp_path, dataset)
+    output = tmp_path / "output.txt"
+
+    assert main(["-i", str(source), "-o", str(output)]) == 0
+
+    x = XTructure()
+    all(map(x.learn_new_word, dataset))
+
+    assert output.read_text().strip() == str(x)
+
+
+def test_main_metrics_file(tmp_path):
+    source = _write_input(tmp_path, [f"ID-{i}" for i in range(250)])
+    output = tmp_path / "output.txt"
+    metrics = tmp_path / "metrics.jsonl"
+
+    main(["-i", str(source), "-o", str(output), "--progress", "100", "--print-pattern-every", "200", "--metrics", str(metrics)])
+
+    reports = [json.loads(line) for line in metrics.read_text().splitlines()]
+
+    assert [report["rows"] for report in reports] == [100, 200, 250]
+    assert all({"elapsed", "rows_per_sec", "branches", "merges", "rss"} <= report.keys() for report in reports)
+    assert "pattern" not in reports[0]
+    assert "pattern" in reports[1]
+    assert reports[2]["pattern"] == output.read_text().strip()
+
+
+def test_main_progress_on_stderr(tmp_path, capsys):
+    source = _write_input(tmp_path, [f"{i}" for i in range(30)])
+
+    main(["-i", str(source), "--progress", "10"])
+
+    captured = capsys.readouterr()
+
+    assert len(captured.err.splitlines()) == 3
+    assert captured.err.startswith("rows=10 ")
+    assert captured.out.strip()
+
+
+def test_reporter_is_called_only_at_intervals():
+    output = io.StringIO()
+    reporter = ProgressReporter(output, every=3, pattern_every=5)
+
+    rows = learn(XTructure(), (str(i) for i in range(11)), reporter)
+
+    assert rows == 11
+    assert [line.split()[0] for line in output.getvalue().splitlines()] == [
+        "rows=3", "rows=5", "rows=6", "rows=9", "rows=10", "rows=11"
+    ]
+
+
+def test_reporter_invalid_interval():
+    with pytest.raises(ValueError):
+        ProgressReporter(io.StringIO(), every=0)
+
+
+def test_merges_are_counted():
+    x = XTructure(max_branches=1)
+
+    for word in ["2022-12-25", "N/A", "FOO"]:
+        x.learn_new_word(word)
+
+    assert x.merges == 2
+
+    other = x.spawn()
+
+    assert other.merges == 0
+
+    other.update(x)
+
+    assert other.merges == 2
+
+
+def test_learn_stops_when_stable():
+    x = XTructure()
+    lines = iter(["1", "2", "1", "2", "1", "2", "100", "2"])
+
+    rows = learn(x, lines, stop_when_stable=3)
+
+    assert rows == 5
+    assert list(lines) == ["2", "100", "2"]
+
+
+def test_main_stop_when_stable_and_validate(tmp_path, capsys):
+    source = _write_input(tmp_path, ["1", "2"] * 10 + ["100", "ABC"] + ["1"] * 100)
+
+    main(["-i", str(source), "--stop-when-stable", "5", "--validate", "50"])
+
+    captured = capsys.readouterr()
+
+    assert "validated=50 mismatches=2" in captured.err
+
+    pattern = re.compile(captured.out.strip())
+
+    assert pattern.match("100")
+
+
+def test_main_rejects_canonical_memory_budget(capsys):
+    with pytest.raises(SystemExit):
+        main(["--canonical", "--memory-budget", "1024"])
+
+    assert "--memory-budget" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize(
+    "options, message",
+    [
+        (["--stop-when-stable", "0"], "--stop-when-stable"),
+        (["--stop-when-stable", "5", "--validate", "-1"], "--validate"),
+        (["--validate", "10"], "--validate requires --stop-when-stable"),
+    ]
+)
+def test_main_rejects_invalid_convergence_options(options, message, capsys):
+    with pytest.raises(SystemExit):
+        main(options)
+
+    assert message in capsys.readouterr().err
+
+
+def test_learn_rejects_empty_stability_window():
+    with pytest.raises(ValueError):
+        learn(XTructure(), ["1"], stop_when_stable=0)
+
+
+def test_reporter_does_not_flush():
+    output = io.StringIO()
+    reporter = ProgressReporter(output, every=2, json_lines=True)
+    x = XTructure(canonical=True)
+
+    learn(x, ["ab", "12", "a-1", "cd", "34"], reporter)
+
+    reports = [json.loads(line) for line in output.getvalue().splitlines()]
+
+    assert not x.branches
+    assert [report["shapes"] for report in reports] == [2, 3, 3]
+    assert all(report["branches"] == 0 for report in reports)
+
+
+@pytest.mark.parametrize("options", [["--stop-when-stable", "5"], ["--stop-when-stable", "5", "--validate", "10"]])
+def test_main_rejects_convergence_with_processes(tmp_path, capsys, options):
+    source = _write_input(tmp_path, ["1", "2"])
+
+    with pytest.raises(SystemExit):
+        main(["-i", str(tmp_path), *options])
+
+    with pytest.raises(SystemExit):
+        main(["-i", str(source), "--processes", "2", *options])
+
+    assert "--stop-when-stable" in capsys.readouterr().err
+
+
+def test_main_progress_does_not_change_pattern(tmp_path):
+    rnd = random.Random(2)
+    dataset = ["".join(rnd.choice("ABab01-./") for _ in range(rnd.randint(1, 8))) for _ in range(300)]
+    source = _write_input(tmp_path, dataset)
+    options = ["-i", str(source), "--max-branch", "4", "--branch-slack", "1.0"]
+
+    outputs = []
+
+    for reporting in ([], ["--progress", "7"], ["--progress", "7", "--print-pattern-every", "5"]):
+        output = tmp_path / f"output-{len(outputs)}.txt"
+        metrics = ["--metrics", str(tmp_path / "metrics.jsonl")] if reporting else []
+        main([*options, *reporting, *metrics, "-o", str(output)])
+        outputs.append(output.read_text())
+
+    assert len(set(outputs)) == 1
@@ -1,6 +1,35 @@
+from __future__ import annotations
+
+import random
+from typing import Callable
+
 import pytest
 
 
 @pytest.fixture(scope="session", autouse=True)
 def faker_session_locale():
     return ['it_IT', 'en_US']
+
+
+def word_generators(rnd: random.Random) -> dict[str, Callable[[], str]]:
+    return {
+        "dates": lambda: f"{rnd.randint(1, 28):02d}-{rnd.randint(1, 12):02d}-{rnd.randint(1900, 2030)}",
+        "slashed_dates": lambda: f"{rnd.randint(1, 28):02d}/{rnd.randint(1, 12):02d}/{rnd.randint(1900, 2030)}",
+        "ssn": lambda: f"{rnd.randint(0, 999):03d}-{rnd.randint(0, 99):02d}-{rnd.randint(0, 9999):04d}",
+        "codes": lambda: rnd.choice(["ID", "IX", "AB"]) + "-" + str(rnd.randint(0, 99999)),
+        "amounts": lambda: f"{rnd.randint(0, 99999)}.{rnd.randint(0, 99):02d}",
+        "letters": lambda: "".join(rnd.choice("ABCDEFGH") for _ in range(rnd.randint(3, 6))),
+        "short": lambda: "".join(rnd.choice("xyz") for _ in range(rnd.randint(1, 3))),
+        "missing": lambda: "N/A",
+    }
+
+
+@pytest.fixture
+def mixed_words():
+    def generate(size: int, seed: int = 0) -> list[str]:
+        rnd = random.Random(seed)
+        generators = list(word_generators(rnd).values())
+
+        return [rnd.choice(generators)() for _ in range(size)]
+
+    return generate
@@ -0,0 +1,101 @@
+import re
+
+import pytest
+
+from xsystem import AsciiClass
+from xsystem import Branch
+from xsystem import Symbol
+from xsystem import Token
+from xsystem import XTructure
+
+
+def test_atom_sorts_and_collapses_ranges():
+    assert Symbol(AsciiClass.DIGIT, set("0312"), False).atom() == "[0-3]"
+    assert Symbol(AsciiClass.DIGIT, set("891652073"), False).atom() == "[0-35-9]"
+    assert Symbol(AsciiClass.DIGIT, set("13"), False).atom() == "[13]"
+    assert Symbol(AsciiClass.DIGIT, set("12"), False).atom() == "[12]"
+    assert Symbol.build(".").atom() == r"\."
+
+
+def test_atom_escapes_set_characters():
+    symbol = Symbol(AsciiClass.PUNCT, set("-]^\\"), False)
+
+    pattern = re.compile(symbol.atom())
+
+    for c in "-]^\\":
+        assert pattern.fullmatch(c), c
+
+    assert not pattern.fullmatch("a")
+
+
+@pytest.mark.parametrize("a_class", [c for c in AsciiClass if c != AsciiClass.CNTRL])
+def test_class_atoms_are_valid_regex(a_class):
+    pattern = re.compile(Symbol(a_class, set(), True).atom())
+
+    if a_class not in {AsciiClass.ALNUM, AsciiClass.ALPHA, AsciiClass.GRAPH, AsciiClass.PRINT, AsciiClass.ANY}:
+        for c in AsciiClass.get_class_characters(a_class):
+            assert pattern.fullmatch(c), c
+
+
+def test_token_quantifiers():
+    assert Token.build("2222").to_regex() == "2{4}"
+    assert Token.build("ab").to_regex() == "ab"
+    assert Token.build("AB").merge(Token.build("ABBB")).to_regex() == "AB{1,3}"
+    assert Token.build("-").as_optional().to_regex() == "-?"
+    assert Token.build("ab").as_optional().to_regex() == "(?:ab)?"
+    assert Token.build("22").as_optional().to_regex() == "(?:2{2})?"
+
+
+def test_common_prefixes_are_factored():
+    x = XTructure(branches=[Branch.build("ID-1"), Branch.build("ID-A"), Branch.build("ID"), Branch.build("N/A")])
+
+    assert x.to_regex() == "^(?:ID(?:-(?:1|A))?|N/A)$"
+
+
+def test_optimised_pattern_is_deterministic_and_anchored():
+    x = XTructure()
+
+    for word in ["2022-12-25", "1999-01-01"]:
+        x.learn_new_word(word)
+
+    assert x.to_regex() == "^[12][09][29]{2}-[01][12]-[02][15]$"
+    assert not re.match(x.to_regex(), "2022-12-25X")
+
+
+def test_optimised_pattern_is_equivalent_to_raw_pattern(mixed_words):
+    for max_branches in [1, 2, 8]:
+        dataset = mixed_words(300, max_branches)
+
+        x = XTructure(max_branches=max_branches)
+        all(map(x.learn_new_word, dataset))
+
+        raw = re.compile("^(?:" + str(x) + ")$")
+        optimised = re.compile(x.to_regex())
+
+        candidates = dataset + mixed_words(300, 100 + max_branches) + [word[:-1] for word in dataset]
+
+        for word in candidates:
+            assert bool(raw.match(word)) == bool(optimised.match(word)), (word, raw.pattern, optimised.pattern)
+
+
+@pytest.mark.parametrize("words", [
+    ["café-12", "thé-3"],
+    ["Ærø", "Åse"],
+    ["x²", "ÿ³"],
+    ["٣٤-ß", "12-é"],
+])
+def test_generalised_classes_match_non_ascii_words(words):
+    x = XTructure(memory_budget=1)
+    all(map(x.learn_new_word, words))
+
+    pattern = re.compile(x.to_regex())
+
+    for word in words:
+        assert pattern.match(word), (word, pattern.pattern)
+
+
+def test_ascii_classes_are_kept_for_ascii_characters():
+    digits = Symbol(AsciiClass.DIGIT, set("0123456789"), True)
+
+    assert digits.atom() == "[0-9]"
+    assert Symbol(AsciiClass.DIGIT, set("012345678٣"), True).atom() != "[0-9]"
@@ -0,0 +1,146 @@
+import gc
+import os
+import pickle
+import random
+import subprocess
+import sys
+import weakref
+
+import pytest
+
+from xsystem import AsciiClass
+from xsystem import Branch
+from xsystem import InternedSymbol
+from xsystem import InternedToken
+from xsystem import Symbol
+from xsystem import Token
+from xsystem import XTructure
+from xsystem import _MEMO_SIZE
+from xsystem import _merge_interned_tokens
+
+
+def test_interned_symbols_are_shared():
+    assert InternedSymbol.build("1") is InternedSymbol.build("1")
+    assert InternedSymbol.intern(Symbol.build("-")) is InternedSymbol.build("-")
+    assert InternedSymbol.get(AsciiClass.DIGIT, {"1", "2"}, False) is InternedSymbol.get(AsciiClass.DIGIT, ["2", "1"], False)
+    assert InternedSymbol.build("1") is not InternedSymbol.build("1").as_optional()
+
+
+def test_interned_tokens_are_shared():
+    b1 = Branch.build("2022-12-25", interned=True)
+    b2 = Branch.build("1999/01-01", interned=True)
+
+    assert b1.tokens[1] is b2.tokens[3]
+    assert InternedToken.intern(Token.build("2022")) is b1.tokens[0]
+
+
+def test_interned_objects_are_immutable():
+    symbol = InternedSymbol.build("a")
+    token = InternedToken.build("abc")
+
+    with pytest.raises(AttributeError):
+        symbol.is_class = True
+
+    with pytest.raises(AttributeError):
+        token.optional = True
+
+    assert isinstance(symbol.chars, frozenset)
+    assert isinstance(token.symbols, tuple)
+
+
+def test_interned_merge_is_memoised():
+    t1 = InternedToken.build("2022")
+    t2 = InternedToken.build("1999")
+
+    merged = t1.merge(t2)
+
+    hits = _merge_interned_tokens.cache_info().hits
+
+    assert t1.merge(t2) is merged
+    assert _merge_interned_tokens.cache_info().hits == hits + 1
+
+
+def test_interned_merge_matches_plain():
+    for a, b in [("AB", "ABD"), ("a", "1"), ("12", "ab"), ("-", "/")]:
+        plain = Token.build(a).merge(Token.build(b))
+        interned = InternedToken.build(a).merge(InternedToken.build(b))
+
+        assert str(plain) == str(interned)
+        assert Token.build(a).fit(Token.build(b)) == InternedToken.build(a).fit(InternedToken.build(b))
+
+
+def test_interned_pickle_roundtrip():
+    branch = Branch.build("2022-12-25", interned=True)
+
+    restored = pickle.loads(pickle.dumps(branch))
+
+    assert all(token is restored_token for token, restored_token in zip(branch.tokens, restored.tokens))
+
+
+def test_interned_symbols_unpickle_in_another_process():
+    symbols = [InternedSymbol.get(ascii_class, set(), True) for ascii_class in AsciiClass]
+    script = (
+        "import pickle, sys\n"
+        "symbols = pickle.loads(sys.stdin.buffer.read())\n"
+        "print(' '.join(symbol.a_class.name for symbol in symbols))\n"
+    )
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=root, input=pickle.dumps(symbols), capture_output=True, check=True
+    )
+
+    assert result.stdout.decode().split() == [ascii_class.name for ascii_class in AsciiClass]
+
+
+@pytest.mark.parametrize("canonical", [False, True])
+def test_interned_learner_matches_plain(canonical, mixed_words):
+    dataset = mixed_words(500, 3)
+
+    plain = XTructure(max_branches=3, canonical=canonical)
+    interned = XTructure(max_branches=3, canonical=canonical, interned=True)
+
+    for word in dataset:
+        plain.learn_new_word(word)
+        interned.learn_new_word(word)
+
+    assert str(interned) == str(plain)
+    assert all(isinstance(token, InternedToken) for branch in interned.branches for token in branch.tokens)
+
+
+def test_interned_learner_with_memory_budget(mixed_words):
+    x = XTructure(interned=True, memory_budget=1)
+
+    for word in mixed_words(100, 3):
+        x.learn_new_word(word)
+
+    assert len(x.branches) == 1
+    assert all(isinstance(token, InternedToken) for token in x.branches[0].tokens)
+    assert all(symbol.is_class for token in x.branches[0].tokens for symbol in token.symbols)
+
+
+def test_interned_tokens_are_released():
+    token = InternedToken.build("qzx-released-42")
+    ref = weakref.ref(token)
+
+    assert InternedToken.build("qzx-released-42") is token
+
+    del token
+    gc.collect()
+
+    assert ref() is None
+
+
+def test_interned_pool_is_bounded_after_learning():
+    rnd = random.Random(5)
+    words = ["".join(rnd.choice("ABCDEFGHJK") for _ in range(12)) for _ in range(3 * _MEMO_SIZE)]
+
+    x = XTructure(interned=True, max_branches=2)
+    all(map(x.learn_new_word, words))
+
+    del x
+    gc.collect()
+
+    # Only the tokens referenced by the memo caches survive the learner
+    assert len(InternedToken._pool) <= 6 * _MEMO_SIZE
+    assert not any(word in InternedToken._built for word in words[:-_MEMO_SIZE])
@@ -0,0 +1,110 @@
+import random
+
+import pytest
+
+from xsystem import XTructure
+from xsystem import input_files
+from xsystem import learn_files
+from xsystem import main
+from xsystem import plan_chunks
+from xsystem import read_chunk
+
+
+@pytest.fixture
+def parts(tmp_path):
+    rnd = random.Random(11)
+
+    directory = tmp_path / "parts"
+    directory.mkdir()
+
+    lines: list[str] = []
+
+    for i, size in enumerate([0, 1, 3, 500, 40, 2000]):
+        part = [
+            rnd.choice([
+                f"{rnd.randint(1, 28):02d}-{rnd.randint(1, 12):02d}-{rnd.randint(1900, 2030)}",
+                f"ID-{rnd.randint(0, 99999)}",
+                "àèìòù"[:rnd.randint(1, 5)],
+            ])
+            for _ in range(size)
+        ]
+        lines.extend(part)
+        (directory / f"part-{i:02d}.txt").write_text("".join(f"{line}\n" for line in part), encoding="utf-8")
+
+    # A file without the trailing newline
+    (directory / "part-99.txt").write_text("N/A\nN/A", encoding="utf-8")
+    lines.extend(["N/A", "N/A"])
+
+    return directory, lines
+
+
+def test_input_files(parts, tmp_path):
+    directory, _ = parts
+
+    files = input_files(str(directory))
+
+    assert len(files) == 7
+    assert files == sorted(files)
+    assert input_files(str(directory / "part-0*.txt")) == files[:-1]
+    assert input_files(str(directory / "part-99.txt")) == files[-1:]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_chunks_cover_every_line_once(parts, chunk_size):
+    directory, lines = parts
+
+    read = [
+        line.rstrip("\n")
+        for path, start, end in plan_chunks(input_files(str(directory)), chunk_size)
+        for line in read_chunk(path, start, end)
+    ]
+
+    assert read == lines
+
+
+def test_plan_chunks_sizes(parts):
+    directory, _ = parts
+
+    chunks = plan_chunks(input_files(str(directory)), 100)
+
+    assert all(0 < end - start <= 100 for _, start, end in chunks)
+
+    with pytest.raises(ValueError):
+        plan_chunks([], 0)
+
+
+def test_learn_files_is_independent_of_processes(parts):
+    directory, lines = parts
+    files = input_files(str(directory))
+
+    sequential = XTructure(max_branches=3)
+    assert learn_files(sequential, files, processes=1, chunk_size=256) == len(lines)
+
+    parallel = XTructure(max_branches=3)
+    assert learn_files(parallel, files, processes=3, chunk_size=256) == len(lines)
+
+    assert str(parallel) == str(sequential)
+
+
+def test_learn_files_canonical_matches_sequential(parts):
+    directory, lines = parts
+
+    x = XTructure(canonical=True, max_branches=3)
+    learn_files(x, input_files(str(directory)), processes=2, chunk_size=100)
+
+    expected = XTructure(canonical=True, max_branches=3)
+    all(map(expected.learn_new_word, lines))
+
+    assert str(x) == str(expected)
+
+
+def test_main_with_directory(parts, tmp_path):
+    directory, lines = parts
+    output = tmp_path / "output.txt"
+
+    main(["-i", str(directory), "-o", str(output), "--canonical", "--processes", "2", "--chunk-size", "512"])
+
+    expected = XTructure(canonical=True)
+    all(map(expected.learn_new_word, lines))
+
+    assert output.read_text().strip() == str(expected)
@@ -0,0 +1,101 @@
+import random
+import re
+import string
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from xsystem import PatternStore
+from xsystem import XTructure
+
+ALPHABET = string.ascii_letters + string.digits + "-_/.# " + "àÈ€"
+
+
+def learn(words, **kwargs):
+    x = XTructure(**kwargs)
+
+    for word in words:
+        x.learn_new_word(word)
+
+    return x
+
+
+def random_words(seed, count):
+    rng = random.Random(seed)
+
+    return ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 12))) for _ in range(count)]
+
+
+@pytest.fixture
+def structures():
+    rng = random.Random(7)
+
+    return {
+        "codes": learn([f"{rng.choice(['AB', 'xy', 'Éa'])}-{rng.randint(0, 9999)}/{rng.choice('qwé')}" for _ in range(200)]),
+        "dates": learn(["2024-01-01", "1999.12.31", "2023-02-03"], alpha=0.25),
+        "random": learn(random_words(1, 200), max_branches=4),
+    }
+
+
+@pytest.fixture
+def path(tmp_path, structures):
+    path = str(tmp_path / "patterns.xsps")
+    PatternStore.write(path, structures)
+
+    return path
+
+
+def test_names(path):
+    with PatternStore(path) as store:
+        assert len(store) == 3
+        assert list(store) == ["codes", "dates", "random"]
+        assert "dates" in store
+        assert "missing" not in store
+
+        with pytest.raises(KeyError):
+            store["missing"]
+
+
+def test_fit_score_matches_xtructure(path, structures):
+    words = random_words(2, 300) + ["-", "a b c", "ÉÉ-12/é", "2024-01-01", "12345678901234"]
+
+    with PatternStore(path) as store:
+        for name, x in structures.items():
+            mapped = store[name]
+
+            assert mapped.alpha == x.alpha
+            assert [mapped.fit_score(word) for word in words] == [x.fit_score(word) for word in words]
+
+
+def test_match(path, structures):
+    words = random_words(3, 100) + ["AB-12/q", "Éa-9999/é", "2023-12-31"]
+
+    with PatternStore(path) as store:
+        for name, x in structures.items():
+            mapped = store[name]
+            pattern = re.compile(x.to_regex())
+
+            assert mapped.to_regex() == x.to_regex()
+            assert [bool(mapped.match(word)) for word in words] == [bool(pattern.match(word)) for word in words]
+
+
+def test_not_a_store(tmp_path):
+    path = tmp_path / "patterns.xsps"
+    path.write_bytes(bytes(PatternStore._HEADER.size))
+
+    with pytest.raises(ValueError):
+        PatternStore(str(path))
+
+
+def _score(path, name, words):
+    with PatternStore(path) as store:
+        return [store[name].fit_score(word) for word in words]
+
+
+def test_workers_share_store(path, structures):
+    words = random_words(4, 50)
+
+    with ProcessPoolExecutor(2) as executor:
+        scores = list(executor.map(_score, [path] * 3, list(structures), [words] * 3))
+
+    assert scores == [[x.fit_score(word) for word in words] for x in structures.values()]
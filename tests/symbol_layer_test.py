@@ -1,8 +1,10 @@
 import math
+import pickle
 import string
 
 from xsystem import AsciiClass
 from xsystem import Symbol
+from xsystem import _NO_CHARS
 
 
 def test_get_ascii_class():
@@ -87,3 +89,20 @@ def test_symbol_merge_to_class():
     assert merged.is_class
     assert len(merged.chars) == len(AsciiClass.get_class_characters(AsciiClass.LOWER))
     assert merged.a_class == AsciiClass.LOWER
+
+
+def test_merge_with_generalised_symbol_keeps_class():
+    generalised = Symbol(AsciiClass.DIGIT, _NO_CHARS, True)
+
+    for merged in (generalised.merge(Symbol.build("a")), Symbol.build("a").merge(generalised)):
+        assert merged.is_class
+        assert merged.a_class == AsciiClass.ALNUM
+
+
+def test_symbols_survive_pickling():
+    for ascii_class in AsciiClass:
+        assert pickle.loads(pickle.dumps(ascii_class)) is ascii_class
+
+    symbol = Symbol.build("a").merge(Symbol.build("1"))
+
+    assert pickle.loads(pickle.dumps(symbol)) == symbol
@@ -0,0 +1,63 @@
+import pytest
+
+from xsystem import XTructure
+
+
+def test_learn_threaded_single_chunk_matches_sequential(mixed_words):
+    dataset = mixed_words(200, 42)
+
+    sequential = XTructure()
+    all(map(sequential.learn_new_word, dataset))
+
+    threaded = XTructure()
+    threaded.learn_threaded(dataset, workers=4, chunk_size=len(dataset))
+
+    assert str(threaded) == str(sequential)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64])
+def test_learn_threaded_is_deterministic(chunk_size, mixed_words):
+    dataset = mixed_words(300, 42)
+
+    expected = XTructure(max_branches=4)
+    expected.learn_threaded(dataset, workers=1, chunk_size=chunk_size)
+
+    for workers in [2, 8]:
+        for _ in range(2):
+            x = XTructure(max_branches=4)
+            x.learn_threaded(iter(dataset), workers=workers, chunk_size=chunk_size)
+
+            assert len(x.branches) <= 4
+            assert str(x) == str(expected)
+
+
+def test_learn_threaded_keeps_existing_branches():
+    x = XTructure()
+    x.learn_new_word("2022-12-25")
+
+    x.learn_threaded(["N/A"] * 10, workers=2, chunk_size=3)
+
+    assert len(x.branches) == 2
+
+
+def test_update_respects_max_branches():
+    x = XTructure(max_branches=2)
+    x.learn_new_word("2022-12-25")
+    x.learn_new_word("N/A")
+
+    other = x.spawn()
+    other.learn_new_word("FOO BAR")
+    other.learn_new_word("12.5")
+
+    x.update(other)
+
+    assert len(x.branches) == 2
+    assert len(other.branches) == 2
+
+
+def test_learn_threaded_invalid_arguments():
+    with pytest.raises(ValueError):
+        XTructure().learn_threaded(["a"], workers=0)
+
+    with pytest.raises(ValueError):
+        XTructure().learn_threaded(["a"], chunk_size=0)
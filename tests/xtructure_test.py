@@ -1,5 +1,6 @@
 import codecs
 import pytest
+from xsystem import Branch
 from xsystem import XTructure
 import pkg_resources  # type: ignore
 
@@ -171,3 +172,218 @@ def test_italian_fiscal_code(faker, faker_session_locale):
     learnt_regex = str(x)
 
     assert learnt_regex
+
+
+def test_footprint_grows_with_detail():
+    x = XTructure()
+
+    x.learn_new_word("1234")
+    initial = x.footprint()
+
+    assert initial > 0
+
+    for i in range(100):
+        x.learn_new_word(f"{i:04d}")
+
+    assert x.footprint() > initial
+
+
+def test_memory_budget_generalises_symbols():
+    dataset = [f"{d:02d}-{m:02d}-{y}" for d in range(1, 29) for m in range(1, 13) for y in (1999, 2023)]
+    dataset += [f"{d:02d}/{m}/{y}" for d in range(1, 29, 3) for m in ("Jan", "feb") for y in (1999, 2023)]
+
+    unbounded = XTructure()
+    all(map(unbounded.learn_new_word, dataset))
+
+    budget = unbounded.footprint() * 3 // 4
+
+    x = XTructure(memory_budget=budget)
+    all(map(x.learn_new_word, dataset))
+
+    assert x.footprint() <= budget
+    assert any(symbol.is_class for branch in x.branches for token in branch.tokens for symbol in token.symbols)
+
+    pattern = re.compile(x.to_regex())
+
+    for date in dataset:
+        assert pattern.match(date), date
+
+
+def test_memory_budget_keeps_generalised_classes():
+    dataset = ["11", "22", "33", "a4", "b5"]
+
+    for budget in (1, 300, 616, 1000):
+        x = XTructure(max_branches=1, memory_budget=budget)
+        all(map(x.learn_new_word, dataset))
+
+        pattern = re.compile(x.to_regex())
+
+        for word in dataset:
+            assert pattern.match(word), (budget, word)
+
+
+def test_memory_budget_merges_branches():
+    x = XTructure(memory_budget=1)
+
+    for word in ["2022-12-25", "N/A", "FOO BAR", "12.5"]:
+        x.learn_new_word(word)
+
+    assert len(x.branches) == 1
+
+
+def test_convergence_counts_unchanged_words():
+    x = XTructure()
+
+    x.learn_new_word("2022-12-25")
+    assert x.stable_words == 0
+
+    x.learn_new_word("2022-12-25")
+    x.learn_new_word("2022-12-25")
+    assert x.stable_words == 2
+    assert x.is_converged(2)
+    assert not x.is_converged(3)
+
+    # New characters change the structure
+    x.learn_new_word("2022-12-26")
+    assert x.stable_words == 0
+
+    x.learn_new_word("2022-12-26")
+    x.learn_new_word("2022-12-25")
+    assert x.stable_words == 2
+
+    # New branches change the structure
+    x.learn_new_word("N/A")
+    assert x.stable_words == 0
+
+
+def test_convergence_optional_tokens():
+    x = XTructure(max_branches=1)
+
+    x.learn_new_word("a-b")
+    x.learn_new_word("a-b-c")
+    assert x.stable_words == 0
+
+    x.learn_new_word("a-b-c")
+    assert x.stable_words == 1
+
+
+def test_convergence_class_generalisation():
+    x = XTructure()
+
+    x.learn_new_word("a1")
+    x.learn_new_word("a1")
+    assert x.stable_words == 1
+
+    x.learn_new_word("aB")
+    assert x.stable_words == 0
+
+
+def test_convergence_canonical():
+    x = XTructure(canonical=True)
+
+    for word in ["12", "34", "12", "34"]:
+        x.learn_new_word(word)
+
+    assert x.is_converged(2)
+
+    x.learn_new_word("1a")
+    assert x.stable_words == 0
+
+
+def _heterogeneous_dataset(size):
+    rnd = random.Random(4)
+    alphabet = "ABCDEFGHabcdefgh0123456789-./"
+
+    return ["".join(rnd.choice(alphabet) for _ in range(rnd.randint(1, 10))) for _ in range(size)]
+
+
+def test_branch_slack_stages_branches():
+    x = XTructure(max_branches=4, branch_slack=0.5)
+
+    assert x.branch_capacity() == 6
+
+    sizes = set()
+
+    for word in _heterogeneous_dataset(300):
+        x.learn_new_word(word)
+        sizes.add(len(x.branches))
+
+    assert max(sizes) == 6
+    assert min(sizes - {1, 2, 3}) == 4
+
+    assert len(x.reduced_branches()) == 4
+    assert str(x)
+
+
+def test_branch_slack_reduction_counts_merges():
+    x = XTructure(max_branches=2, branch_slack=1.0)
+
+    for word in ["2022-12-25", "N/A", "FOO BAR", "12.5"]:
+        x.learn_new_word(word)
+
+    assert len(x.branches) == 4
+    assert x.merges == 0
+
+    assert str(x)
+    assert len(x.reduced_branches()) == 2
+    assert len(x.branches) == 4
+    assert x.merges == 0
+
+    x.learn_new_word("ab#cd")
+
+    assert len(x.branches) == 2
+    assert x.merges == 3
+
+
+def test_branch_slack_reads_do_not_change_learning():
+    dataset = _heterogeneous_dataset(300)
+
+    x = XTructure(max_branches=4, branch_slack=1.0)
+    y = XTructure(max_branches=4, branch_slack=1.0)
+
+    for i, word in enumerate(dataset):
+        x.learn_new_word(word)
+        y.learn_new_word(word)
+
+        if i % 3 == 0:
+            branches = len(y.branches)
+            y.fit_score("abc")
+            str(y)
+            assert len(y.branches) == branches
+
+    assert str(y) == str(x)
+    assert y.merges == x.merges
+
+
+def test_branch_slack_reuses_cached_distances(monkeypatch):
+    x = XTructure(max_branches=4, branch_slack=1.0)
+    dataset = _heterogeneous_dataset(200)
+
+    calls = []
+    fit = Branch.fit
+
+    def counting_fit(self, other):
+        calls.append(1)
+        return fit(self, other)
+
+    monkeypatch.setattr(Branch, "fit", counting_fit)
+
+    for word in dataset:
+        x.learn_new_word(word)
+
+    reductions = x.merges // 5
+    assert reductions > 1
+    # Without the cache every reduction would compute all the pairwise distances of the 9 staged branches
+    assert len(calls) < reductions * 36
+
+
+def test_branch_slack_pattern_matches_input():
+    dataset = [f"{i:04d}" for i in range(0, 10000, 37)] + ["N/A", "ID-1", "ID-22"]
+
+    x = XTructure(max_branches=2, branch_slack=2.0)
+    all(map(x.learn_new_word, dataset))
+
+    pattern = re.compile(x.to_regex())
+
+    for word in dataset:
+        assert pattern.match(word), word
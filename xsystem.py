@@ -1,37 +1,67 @@
 from __future__ import annotations
 from argparse import ArgumentParser, Namespace
+from array import array
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 from itertools import combinations
+from itertools import islice
+import glob
+import json
 import math
+import mmap
+import os
 
 import sys
 import string
+import struct
+import time
 
 from dataclasses import dataclass
 from dataclasses import field
+from dataclasses import replace
 
 from enum import Enum
 from enum import auto
+from functools import lru_cache
 import re
 from re import Match
 from re import Pattern
+from typing import AbstractSet
 from typing import Generator
+from typing import Iterable
+from typing import Iterator
+from typing import Literal
 from typing import Optional
+from typing import Sequence
+from typing import TextIO
+from typing import Union
+from weakref import WeakValueDictionary
+
+try:
+    import _xsystem_speedups  # type: ignore
+except ImportError:  # pragma: no cover
+    _xsystem_speedups = None
 
 
 class AsciiClass(Enum):
-    ALNUM = auto(),  # Alphanumeric characters: ‘[:alpha:]’ and ‘[:digit:]’; in the ‘C’ locale and ASCII character encoding, this is the same as ‘[0-9A-Za-z]’.
-    ALPHA = auto(),  # Alphabetic characters: ‘[:lower:]’ and ‘[:upper:]’; in the ‘C’ locale and ASCII character encoding, this is the same as ‘[A-Za-z]’.
-    BLANK = auto(),  # Blank characters: space and tab.
-    CNTRL = auto(),  # Control characters. In ASCII, these characters have octal codes 000 through 037, and 177 (DEL). In other character sets, these are the equivalent characters, if any.
-    DIGIT = auto(),  # Digits: 0 1 2 3 4 5 6 7 8 9.
-    GRAPH = auto(),  # Graphical characters: ‘[:alnum:]’ and ‘[:punct:]’.
-    LOWER = auto(),  # Lower-case letters; in the ‘C’ locale and ASCII character encoding, this is a b c d e f g h i j k l m n o p q r s t u v w x y z.
-    PRINT = auto(),  # Printable characters: ‘[:alnum:]’, ‘[:punct:]’, and space.
-    PUNCT = auto(),  # Punctuation characters; in the ‘C’ locale and ASCII character encoding, this is ! " # $ % & ' ( ) * + , - . / : ; < = > ? @ [ \ ] ^ _ ` { | } ~.
-    SPACE = auto(),  # Space characters: in the ‘C’ locale, this is tab, newline, vertical tab, form feed, carriage return, and space. See Usage, for more discussion of matching newlines.
-    UPPER = auto(),  # Upper-case letters: in the ‘C’ locale and ASCII character encoding, this is A B C D E F G H I J K L M N O P Q R S T U V W X Y Z.
-    XDIGIT = auto(),  # Hexadecimal digits: 0 1 2 3 4 5 6 7 8 9 A B C D E F a b c d e f.
-    ANY = auto(),
+    ALNUM = auto()  # Alphanumeric characters: ‘[:alpha:]’ and ‘[:digit:]’; in the ‘C’ locale and ASCII character encoding, this is the same as ‘[0-9A-Za-z]’.
+    ALPHA = auto()  # Alphabetic characters: ‘[:lower:]’ and ‘[:upper:]’; in the ‘C’ locale and ASCII character encoding, this is the same as ‘[A-Za-z]’.
+    BLANK = auto()  # Blank characters: space and tab.
+    CNTRL = auto()  # Control characters. In ASCII, these characters have octal codes 000 through 037, and 177 (DEL). In other character sets, these are the equivalent characters, if any.
+    DIGIT = auto()  # Digits: 0 1 2 3 4 5 6 7 8 9.
+    GRAPH = auto()  # Graphical characters: ‘[:alnum:]’ and ‘[:punct:]’.
+    LOWER = auto()  # Lower-case letters; in the ‘C’ locale and ASCII character encoding, this is a b c d e f g h i j k l m n o p q r s t u v w x y z.
+    PRINT = auto()  # Printable characters: ‘[:alnum:]’, ‘[:punct:]’, and space.
+    PUNCT = auto()  # Punctuation characters; in the ‘C’ locale and ASCII character encoding, this is ! " # $ % & ' ( ) * + , - . / : ; < = > ? @ [ \ ] ^ _ ` { | } ~.
+    SPACE = auto()  # Space characters: in the ‘C’ locale, this is tab, newline, vertical tab, form feed, carriage return, and space. See Usage, for more discussion of matching newlines.
+    UPPER = auto()  # Upper-case letters: in the ‘C’ locale and ASCII character encoding, this is A B C D E F G H I J K L M N O P Q R S T U V W X Y Z.
+    XDIGIT = auto()  # Hexadecimal digits: 0 1 2 3 4 5 6 7 8 9 A B C D E F a b c d e f.
+    ANY = auto()
 
     @staticmethod
     def get_parent(cls: AsciiClass) -> Optional[AsciiClass]:
@@ -94,6 +124,61 @@ class AsciiClass(Enum):
             return r"."
         raise ValueError(f"Unsupported ASCII class {cls}")
 
+    @staticmethod
+    def get_ascii_class_regex(cls: AsciiClass) -> str:
+        """Return a pattern matching one character of the class, supported by the re module."""
+        if cls == AsciiClass.ALNUM:
+            return r"[0-9A-Za-z]"
+        if cls == AsciiClass.ALPHA:
+            return r"[A-Za-z]"
+        if cls == AsciiClass.BLANK:
+            return r"[ \t]"
+        if cls == AsciiClass.CNTRL:
+            return r"[\x00-\x1f\x7f]"
+        if cls == AsciiClass.DIGIT:
+            return r"[0-9]"
+        if cls == AsciiClass.GRAPH:
+            return r"[!-~]"
+        if cls == AsciiClass.LOWER:
+            return r"[a-z]"
+        if cls == AsciiClass.PRINT:
+            return r"[ -~]"
+        if cls == AsciiClass.PUNCT:
+            return r"[!-/:-@\[-`{-~]"
+        if cls == AsciiClass.SPACE:
+            return r"\s"
+        if cls == AsciiClass.UPPER:
+            return r"[A-Z]"
+        if cls == AsciiClass.XDIGIT:
+            return r"[0-9A-Fa-f]"
+        if cls == AsciiClass.ANY:
+            return r"."
+        raise ValueError(f"Unsupported ASCII class {cls}")
+
+    @staticmethod
+    def get_unicode_class_regex(cls: AsciiClass) -> str:
+        """Return a pattern matching any character that get_ascii_class assigns to the class or to a descendant."""
+        if cls == AsciiClass.ALNUM:
+            return r"[^\W_]"
+        if cls == AsciiClass.ALPHA:
+            return r"[^\W\d_]"
+        if cls == AsciiClass.DIGIT:
+            # str.isdigit also accepts digits that are not decimal, such as superscripts, unlike \d
+            return "[\\d" + _non_decimal_digits() + "]"
+        if cls == AsciiClass.GRAPH:
+            return r"\S"
+        if cls == AsciiClass.LOWER:
+            return r"(?:(?![A-Z])[^\W\d_])"
+        if cls == AsciiClass.PRINT:
+            return r"[\s\S]"
+        if cls == AsciiClass.PUNCT:
+            return r"(?:_|[^\w\s])"
+        if cls == AsciiClass.SPACE:
+            return r"\s"
+        if cls == AsciiClass.UPPER:
+            return r"(?:(?![a-z])[^\W\d_])"
+        return AsciiClass.get_ascii_class_regex(cls)
+
     @staticmethod
     def get_class_characters(symbol_class: AsciiClass) -> set[str]:
         if symbol_class == AsciiClass.ALNUM:
@@ -187,41 +272,30 @@ class AsciiClass(Enum):
         raise ValueError()
 
 
+# Character set shared by all the symbols generalised to their class
+_NO_CHARS: frozenset[str] = frozenset()
+
+
 @dataclass
 class Symbol:
     a_class: AsciiClass
-    chars: set[str]
+    chars: AbstractSet[str]
     is_class: bool
     is_optional: bool = False
 
     def fit_score(self, s: str, alpha: float) -> float:
-        if AsciiClass.get_ascii_class(s) == self.a_class:
-            return 0
-        if not self.is_class and s in self.chars:
-            return alpha
-        return 1
+        return _backend.symbol_fit_score(self, s, alpha)
 
     def __str__(self) -> str:
         if self.is_class:
-            return AsciiClass.get_ascii_class_pattern(self.a_class)
+            return AsciiClass.get_ascii_class_pattern(self.a_class) + ("?" if self.is_optional else "")
         elif len(self.chars) == 1:
             return self._sanitize(next(iter(self.chars))) + ("?" if self.is_optional else "")
         else:
-            return "[" + "".join(Symbol._sanitize(c) for c in self.chars) + "]" + ("?" if self.is_optional else "")
+            return "[" + "".join(Symbol._sanitize(c) for c in sorted(self.chars)) + "]" + ("?" if self.is_optional else "")
 
     def fit(self, other: Symbol) -> float:
-        if self.a_class == other.a_class:
-            return 0
-        if AsciiClass.find_common_ancestor(self.a_class, other.a_class) == other.a_class:
-            return 0
-        if AsciiClass.find_common_ancestor(self.a_class, other.a_class) == self.a_class:
-            return 0
-
-        common_chars = len(self.chars & other.chars)
-        if common_chars != 0:
-            return 1 - common_chars / len(self.chars)
-        else:
-            return 1
+        return _backend.symbol_fit(self, other)
 
     @staticmethod
     def _sanitize(c: str) -> str:
@@ -229,19 +303,63 @@ class Symbol:
             return f"\\{c}"
         return c
 
+    @staticmethod
+    def _sanitize_in_set(c: str) -> str:
+        if c in "\\[]^-":
+            return f"\\{c}"
+        return c
+
+    def atom(self) -> str:
+        """Return an optimised pattern matching one character of the symbol, ignoring is_optional.
+
+        Characters are sorted and runs of at least three consecutive characters are collapsed into ranges.
+        """
+        if self.is_class:
+            # A class generalised from unknown or non ASCII characters stands for all the characters of the class
+            if not self.chars or not all(c.isascii() for c in self.chars):
+                return AsciiClass.get_unicode_class_regex(self.a_class)
+
+            return AsciiClass.get_ascii_class_regex(self.a_class)
+
+        chars = sorted(self.chars)
+
+        if len(chars) == 1:
+            return Symbol._sanitize(chars[0])
+
+        return "[" + Symbol._ranges(chars) + "]"
+
+    @staticmethod
+    def _ranges(chars: Sequence[str]) -> str:
+        """Return the sorted characters as the content of a character set, with runs of three or more as ranges."""
+        parts: list[str] = []
+        start = 0
+
+        for end in range(1, len(chars) + 1):
+            if end < len(chars) and ord(chars[end]) == ord(chars[end - 1]) + 1:
+                continue
+
+            if end - start >= 3:
+                parts.append(Symbol._sanitize_in_set(chars[start]) + "-" + Symbol._sanitize_in_set(chars[end - 1]))
+            else:
+                parts.extend(Symbol._sanitize_in_set(c) for c in chars[start:end])
+
+            start = end
+
+        return "".join(parts)
+
     def merge(self, other: Symbol) -> Symbol:
-        if other.a_class != self.a_class:
-            na_class = AsciiClass.find_common_ancestor(other.a_class, self.a_class)
-        else:
-            na_class = self.a_class
+        return _backend.symbol_merge(self, other)
 
-        chars = self.chars | other.chars
+    def as_optional(self) -> Symbol:
+        return Symbol(self.a_class, self.chars, self.is_class, True)
 
-        return Symbol(
-            na_class,
-            chars=chars,
-            is_class=len(chars) == len(AsciiClass.get_class_characters(na_class))
-        )
+    def generalise(self) -> Symbol:
+        """Return the symbol generalised to its class, dropping the character detail."""
+        return Symbol(self.a_class, chars=_NO_CHARS, is_class=True, is_optional=self.is_optional)
+
+    def footprint(self) -> int:
+        """Approximate size in bytes of the symbol, including its character set."""
+        return sys.getsizeof(self) + (sys.getsizeof(self.chars) if self.chars else 0)
 
     @staticmethod
     def build(symbol: str) -> Symbol:
@@ -255,32 +373,37 @@ class Symbol:
 
 @dataclass
 class Token:
-    symbols: list[Symbol] = field(default_factory=list)
+    symbols: Sequence[Symbol] = field(default_factory=list)
     optional: bool = False
 
     def fit_score(self, t: str, alpha: float) -> float:
-        return sum(
-            symbol.fit_score(tuple_element, alpha) for symbol, tuple_element in zip(self.symbols, Token.get_symbols_in_token(t))
-        ) + abs(
-            len(t) - len(self.symbols)
-        )
+        return _backend.token_fit_score(self, t, alpha)
 
     def merge(self, other: Token) -> Token:
-        symbols = [symbol.merge(other_symbol) for symbol, other_symbol in zip(self.symbols, other.symbols)]
+        return _backend.token_merge(self, other)
 
-        if len(self.symbols) == len(other.symbols):
-            return Token(symbols=symbols, optional=self.optional or other.optional)
-        elif len(self.symbols) > len(other.symbols):
-            missing = [Symbol(s.a_class, s.chars, s.is_class, True) for s in self.symbols[len(other.symbols):]]
-        else:
-            missing = [Symbol(s.a_class, s.chars, s.is_class, True) for s in other.symbols[len(self.symbols):]]
+    def fit(self, other: Token) -> float:
+        return _backend.token_fit(self, other)
 
-        return Token(symbols=symbols + missing, optional=self.optional or other.optional)
+    def as_optional(self) -> Token:
+        return Token(self.symbols, True)
 
-    def fit(self, other: Token) -> float:
-        return sum(
-            symbol.fit(other_symbol) for symbol, other_symbol in zip(self.symbols, other.symbols)
-        ) + abs(len(self.symbols) - len(other.symbols))
+    def generalise(self, min_chars: int) -> Token:
+        """Return the token with the symbols with at least min_chars characters generalised to their class."""
+        if not any(not symbol.is_class and len(symbol.chars) >= min_chars for symbol in self.symbols):
+            return self
+
+        return Token(
+            [
+                symbol.generalise() if not symbol.is_class and len(symbol.chars) >= min_chars else symbol
+                for symbol in self.symbols
+            ],
+            self.optional
+        )
+
+    def footprint(self) -> int:
+        """Approximate size in bytes of the token, including its symbols."""
+        return sys.getsizeof(self) + sys.getsizeof(self.symbols) + sum(symbol.footprint() for symbol in self.symbols)
 
     @staticmethod
     def get_symbols_in_token(t: str) -> Generator[str, None, None]:
@@ -290,6 +413,42 @@ class Token:
     def __str__(self) -> str:
         return "(" + "".join(str(symbol) for symbol in self.symbols) + ")" + ("?" if self.optional else "")
 
+    def to_regex(self) -> str:
+        """Return an optimised pattern for the token.
+
+        Adjacent symbols with the same atom are merged into a single quantified atom, and a non capturing group is
+        only used if the token is optional and does not consist of a single unquantified atom.
+        """
+        runs: list[tuple[str, int, int]] = []
+
+        for symbol in self.symbols:
+            atom = symbol.atom()
+            required = 0 if symbol.is_optional else 1
+
+            if runs and runs[-1][0] == atom:
+                _, min_count, max_count = runs[-1]
+                runs[-1] = (atom, min_count + required, max_count + 1)
+            else:
+                runs.append((atom, required, 1))
+
+        pattern = "".join(atom + Token._quantifier(min_count, max_count) for atom, min_count, max_count in runs)
+
+        if not self.optional:
+            return pattern
+
+        if len(runs) == 1 and runs[0][1:] == (1, 1):
+            return pattern + "?"
+
+        return "(?:" + pattern + ")?"
+
+    @staticmethod
+    def _quantifier(min_count: int, max_count: int) -> str:
+        if min_count == max_count:
+            return "" if max_count == 1 else f"{{{max_count}}}"
+        if (min_count, max_count) == (0, 1):
+            return "?"
+        return f"{{{min_count},{max_count}}}"
+
     @staticmethod
     def build(word: str) -> Token:
         return Token(
@@ -302,49 +461,193 @@ class NullToken(Token):
         return 1.0 * len(t)
 
 
+# Size of the caches of the results of merge and fit on pairs of interned objects. The caches hold strong references
+# to their arguments and results, which keeps them in the pools, so they are kept small
+_MEMO_SIZE = 1 << 10
+
+
+class InternedSymbol(Symbol):
+    """Immutable, hash-consed Symbol.
+
+    Equal interned symbols are the same object, so they can be shared across branches and learners, compared and
+    hashed by identity, and the results of merge and fit are memoised on pairs of them.
+    """
+
+    _pool: WeakValueDictionary[tuple[AsciiClass, frozenset[str], bool, bool], InternedSymbol] = WeakValueDictionary()
+
+    def __init__(self, a_class: AsciiClass, chars: frozenset[str], is_class: bool, is_optional: bool = False) -> None:
+        object.__setattr__(self, "a_class", a_class)
+        object.__setattr__(self, "chars", chars)
+        object.__setattr__(self, "is_class", is_class)
+        object.__setattr__(self, "is_optional", is_optional)
+
+    def __setattr__(self, name: str, value: object) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __reduce__(self) -> tuple[object, ...]:
+        return InternedSymbol.get, (self.a_class, self.chars, self.is_class, self.is_optional)
+
+    def merge(self, other: Symbol) -> InternedSymbol:
+        return _merge_interned_symbols(self, InternedSymbol.intern(other))
+
+    def fit(self, other: Symbol) -> float:
+        return _fit_interned_symbols(self, InternedSymbol.intern(other))
+
+    def as_optional(self) -> InternedSymbol:
+        return InternedSymbol.get(self.a_class, self.chars, self.is_class, True)
+
+    def generalise(self) -> InternedSymbol:
+        return InternedSymbol.intern(Symbol.generalise(self))
+
+    @staticmethod
+    def get(a_class: AsciiClass, chars: AbstractSet[str], is_class: bool, is_optional: bool = False) -> InternedSymbol:
+        key = (a_class, frozenset(chars), is_class, is_optional)
+
+        symbol = InternedSymbol._pool.get(key)
+
+        if symbol is None:
+            symbol = InternedSymbol._pool.setdefault(key, InternedSymbol(*key))
+
+        return symbol
+
+    @staticmethod
+    def intern(symbol: Symbol) -> InternedSymbol:
+        if isinstance(symbol, InternedSymbol):
+            return symbol
+
+        return InternedSymbol.get(symbol.a_class, symbol.chars, symbol.is_class, symbol.is_optional)
+
+    @staticmethod
+    @lru_cache(maxsize=_MEMO_SIZE)
+    def build(symbol: str) -> InternedSymbol:
+        return InternedSymbol.intern(Symbol.build(symbol))
+
+
+class InternedToken(Token):
+    """Immutable, hash-consed Token made of interned symbols, see InternedSymbol."""
+
+    symbols: tuple[InternedSymbol, ...]
+
+    _pool: WeakValueDictionary[tuple[tuple[InternedSymbol, ...], bool], InternedToken] = WeakValueDictionary()
+    _built: WeakValueDictionary[str, InternedToken] = WeakValueDictionary()
+
+    def __init__(self, symbols: tuple[InternedSymbol, ...], optional: bool = False) -> None:
+        object.__setattr__(self, "symbols", symbols)
+        object.__setattr__(self, "optional", optional)
+
+    def __setattr__(self, name: str, value: object) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __reduce__(self) -> tuple[object, ...]:
+        return InternedToken.get, (self.symbols, self.optional)
+
+    def merge(self, other: Token) -> InternedToken:
+        return _merge_interned_tokens(self, InternedToken.intern(other))
+
+    def fit(self, other: Token) -> float:
+        return _fit_interned_tokens(self, InternedToken.intern(other))
+
+    def as_optional(self) -> InternedToken:
+        return InternedToken.get(self.symbols, True)
+
+    def generalise(self, min_chars: int) -> InternedToken:
+        return InternedToken.intern(Token.generalise(self, min_chars))
+
+    @staticmethod
+    def get(symbols: Iterable[Symbol], optional: bool = False) -> InternedToken:
+        key = (tuple(InternedSymbol.intern(symbol) for symbol in symbols), optional)
+
+        token = InternedToken._pool.get(key)
+
+        if token is None:
+            token = InternedToken._pool.setdefault(key, InternedToken(*key))
+
+        return token
+
+    @staticmethod
+    def intern(token: Token) -> InternedToken:
+        if isinstance(token, InternedToken):
+            return token
+
+        return InternedToken.get(token.symbols, token.optional)
+
+    @staticmethod
+    def build(word: str) -> InternedToken:
+        # The tokens built are indexed by word weakly, unlike with a cache, so that they can leave the pool
+        token = InternedToken._built.get(word)
+
+        if token is None:
+            token = InternedToken._built.setdefault(word, InternedToken.get(InternedSymbol.build(symbol) for symbol in word))
+
+        return token
+
+
+@lru_cache(maxsize=_MEMO_SIZE)
+def _merge_interned_symbols(symbol: InternedSymbol, other: InternedSymbol) -> InternedSymbol:
+    return InternedSymbol.intern(Symbol.merge(symbol, other))
+
+
+@lru_cache(maxsize=_MEMO_SIZE)
+def _fit_interned_symbols(symbol: InternedSymbol, other: InternedSymbol) -> float:
+    return Symbol.fit(symbol, other)
+
+
+@lru_cache(maxsize=_MEMO_SIZE)
+def _merge_interned_tokens(token: InternedToken, other: InternedToken) -> InternedToken:
+    return InternedToken.intern(Token.merge(token, other))
+
+
+@lru_cache(maxsize=_MEMO_SIZE)
+def _fit_interned_tokens(token: InternedToken, other: InternedToken) -> float:
+    return Token.fit(token, other)
+
+
 @dataclass
 class Branch:
     tokens: list[Token] = field(default_factory=list)
 
     def fit_score(self, t: str, alpha: float) -> float:
-        tokens: list[Token] = [self.tokens[i] if i < len(self.tokens) else NullToken() for i, _ in enumerate(t)]
-
-        return sum(
-            token.fit_score(t_i, alpha) for token, t_i in zip(tokens, Branch.get_tokens_in_tuple(t))
-        )
+        return _backend.branch_fit_score(self, t, alpha)
 
     def add(self, word: str) -> None:
-        self.tokens = [token.merge(nt) for nt, token in zip(Branch.build(word).tokens, self.tokens)]
+        self.tokens = [token.merge(type(token).build(t)) for t, token in zip(Branch.get_tokens_in_tuple(word), self.tokens)]
 
     def __str__(self) -> str:
         return "".join(str(token) for token in self.tokens)
 
     def fit(self, other: Branch) -> float:
-        return sum(
-            token.fit(other_token) for token, other_token in zip(self.tokens, other.tokens)
-        ) + abs(len(self.tokens) - len(other.tokens))
+        return _backend.branch_fit(self, other)
 
     def merge(self, other: Branch) -> Branch:
-        tokens = [
-            token.merge(other_token) for token, other_token in zip(self.tokens, other.tokens)
-        ]
+        return _backend.branch_merge(self, other)
 
-        if len(self.tokens) == len(other.tokens):
-            return Branch(tokens)
-        elif len(self.tokens) > len(other.tokens):
-            missing = [
-                Token(token.symbols, True) for token in self.tokens[len(other.tokens):]
-            ]
+    def generalise(self, min_chars: int = 2) -> bool:
+        """Generalise to their class the symbols with at least min_chars characters.
 
-            assert len(tokens) + len(missing) == len(self.tokens)
-        else:
-            missing = [
-                Token(token.symbols, True) for token in other.tokens[len(self.tokens):]
-            ]
+        Returns True if any symbol was generalised.
+        """
+        tokens = [token.generalise(min_chars) for token in self.tokens]
+        changed = any(token is not old for token, old in zip(tokens, self.tokens))
 
-            assert len(tokens) + len(missing) == len(other.tokens)
+        self.tokens = tokens
 
-        return Branch(tokens + missing)
+        return changed
+
+    def footprint(self) -> int:
+        """Approximate size in bytes of the branch, including its tokens."""
+        return sys.getsizeof(self) + sys.getsizeof(self.tokens) + sum(token.footprint() for token in self.tokens)
 
     @staticmethod
     def get_tokens_in_tuple(t: str, delimiters: str = r"[-_/\\#., ]") -> Generator[str, None, None]:
@@ -367,11 +670,17 @@ class Branch:
         else:
             yield t[last_match.end():]
 
+    def intern(self) -> Branch:
+        """Return a branch with the same tokens, interned."""
+        return Branch([InternedToken.intern(token) for token in self.tokens])
+
     @staticmethod
-    def build(word: str) -> Branch:
+    def build(word: str, interned: bool = False) -> Branch:
+        builder = InternedToken.build if interned else Token.build
+
         return Branch(
             tokens=[
-                Token.build(token) for token in Branch.get_tokens_in_tuple(word)
+                builder(token) for token in Branch.get_tokens_in_tuple(word)
             ]
         )
 
@@ -379,118 +688,1346 @@ class Branch:
         return f"Branch[{str(self)}"
 
 
-@dataclass
-class XTructure:
-    alpha: float = 1 / 5
-    max_branches: int = 8
-    branching_threshold: float = 0.85
+class ScoringBackend:
+    """Scoring and merge primitives of Symbol, Token and Branch.
 
-    branches: list[Branch] = field(default_factory=list)
+    This class is the reference, pure Python implementation, and the interface of the backends: an accelerated
+    backend subclasses it and overrides the primitives it implements, which must return the same results. The
+    methods of Symbol, Token and Branch delegate to the backend selected with set_backend().
+    """
 
-    def fit_score(self, t: str) -> float:
-        return min(b.fit_score(t, self.alpha) for b in self.branches)
+    name = "python"
 
-    def learn_new_word(self, word: str) -> bool:
-        if len(word) == 0:
-            return False
+    def symbol_fit_score(self, symbol: Symbol, s: str, alpha: float) -> float:
+        if AsciiClass.get_ascii_class(s) == symbol.a_class:
+            return 0
+        if not symbol.is_class and s in symbol.chars:
+            return alpha
+        return 1
 
-        if not len(self.branches):
-            self.branches.append(Branch.build(word))
+    def symbol_fit(self, symbol: Symbol, other: Symbol) -> float:
+        if symbol.a_class == other.a_class:
+            return 0
+        if AsciiClass.find_common_ancestor(symbol.a_class, other.a_class) == other.a_class:
+            return 0
+        if AsciiClass.find_common_ancestor(symbol.a_class, other.a_class) == symbol.a_class:
+            return 0
 
+        common_chars = len(symbol.chars & other.chars)
+        if common_chars != 0:
+            return 1 - common_chars / len(symbol.chars)
         else:
-            best_branch, score = self._best_branch(word)
+            return 1
 
-            if score < self.branching_threshold:
-                best_branch.add(word)
-            else:
-                self.branches.append(
-                    Branch.build(word)
-                )
+    def symbol_merge(self, symbol: Symbol, other: Symbol) -> Symbol:
+        if other.a_class != symbol.a_class:
+            na_class = AsciiClass.find_common_ancestor(other.a_class, symbol.a_class)
+        else:
+            na_class = symbol.a_class
 
-            if len(self.branches) > self.max_branches:
-                self.branches = self.merge_most_similar()
+        is_optional = symbol.is_optional or other.is_optional
 
-        return True
+        # A symbol generalised to its class has no character detail left, so the merge is generalised to the class
+        # including both, which matches all the characters of the class already accepted
+        if any(s.is_class and not s.chars for s in (symbol, other)):
+            return Symbol(na_class, chars=_NO_CHARS, is_class=True, is_optional=is_optional)
 
-    def _best_branch(self, word: str) -> tuple[Branch, float]:
-        assert len(self.branches)
+        chars = symbol.chars | other.chars
 
-        best_score = math.inf
-        best_branch: Optional[Branch] = None
+        return Symbol(
+            na_class,
+            chars=chars,
+            is_class=len(chars) == len(AsciiClass.get_class_characters(na_class)),
+            is_optional=is_optional
+        )
 
-        for branch in self.branches:
-            branch_score = branch.fit_score(word, self.alpha)
+    def token_fit_score(self, token: Token, t: str, alpha: float) -> float:
+        # The scores are added in order rather than with sum(), which is compensated since Python 3.12, so that all
+        # the backends and MappedXTructure return the same floats
+        score: float = 0
+        for symbol, tuple_element in zip(token.symbols, t):
+            score += self.symbol_fit_score(symbol, tuple_element, alpha)
 
-            if branch_score < best_score:
-                best_branch = branch
-                best_score = branch_score
+        return score + abs(len(t) - len(token.symbols))
 
-        assert best_branch is not None
-        assert best_score != math.inf
+    def token_fit(self, token: Token, other: Token) -> float:
+        score: float = 0
+        for symbol, other_symbol in zip(token.symbols, other.symbols):
+            score += symbol.fit(other_symbol)
 
-        return best_branch, best_score
+        return score + abs(len(token.symbols) - len(other.symbols))
 
-    def merge_most_similar(self) -> list[Branch]:
-        min_distance = math.inf
-        m_bi: Optional[Branch] = None
-        m_bj: Optional[Branch] = None
+    def token_merge(self, token: Token, other: Token) -> Token:
+        symbols = [symbol.merge(other_symbol) for symbol, other_symbol in zip(token.symbols, other.symbols)]
 
-        for bi, bj in combinations(self.branches, 2):
-            assert bi is not bj
+        if len(token.symbols) == len(other.symbols):
+            return Token(symbols=symbols, optional=token.optional or other.optional)
+        elif len(token.symbols) > len(other.symbols):
+            missing = [s.as_optional() for s in token.symbols[len(other.symbols):]]
+        else:
+            missing = [s.as_optional() for s in other.symbols[len(token.symbols):]]
 
-            distance = bi.fit(bj)
+        return Token(symbols=symbols + missing, optional=token.optional or other.optional)
 
-            if distance < min_distance:
-                min_distance = distance
-                m_bi = bi
-                m_bj = bj
+    def branch_fit_score(self, branch: Branch, t: str, alpha: float) -> float:
+        tokens: list[Token] = [branch.tokens[i] if i < len(branch.tokens) else NullToken() for i, _ in enumerate(t)]
 
-        assert m_bi is not None
-        assert m_bj is not None
+        score: float = 0
+        for token, t_i in zip(tokens, Branch.get_tokens_in_tuple(t)):
+            score += token.fit_score(t_i, alpha)
 
-        self.branches.remove(m_bi)
-        self.branches.remove(m_bj)
+        return score
 
-        self.branches.append(m_bi.merge(m_bj))
+    def branch_fit(self, branch: Branch, other: Branch) -> float:
+        score: float = 0
+        for token, other_token in zip(branch.tokens, other.tokens):
+            score += token.fit(other_token)
 
-        return self.branches
+        return score + abs(len(branch.tokens) - len(other.tokens))
 
-    def __str__(self) -> str:
-        return "|".join(str(branch) for branch in self.branches)
+    def branch_merge(self, branch: Branch, other: Branch) -> Branch:
+        tokens = [
+            token.merge(other_token) for token, other_token in zip(branch.tokens, other.tokens)
+        ]
 
+        if len(branch.tokens) == len(other.tokens):
+            return Branch(tokens)
+        elif len(branch.tokens) > len(other.tokens):
+            missing = [
+                token.as_optional() for token in branch.tokens[len(other.tokens):]
+            ]
 
-def parse_arguments() -> Namespace:
-    parser = ArgumentParser(
-        prog=sys.argv[0].split("/")[-1],
-        description="A simple tool to learn human readable a regular expression from examples",
-    )
+            assert len(tokens) + len(missing) == len(branch.tokens)
+        else:
+            missing = [
+                token.as_optional() for token in other.tokens[len(branch.tokens):]
+            ]
 
-    parser.add_argument("-i", "--input", help="Path to the input source, defaults to stdin")
-    parser.add_argument("-o", "--output", help="Path to the output file, defaults to stdout")
-    parser.add_argument("--max-branch", type=int, default=8, help="Maximum number of branches allowed, defaults to 8")
-    parser.add_argument("--alpha", type=float, default=1 / 5, help="Weight for fitting tuples, defaults to 1/5")
-    parser.add_argument("--branch-threshold", type=float, default=.85, help="Branching threshold, defaults to 0.85, relative to the fitting score alpha")
+            assert len(tokens) + len(missing) == len(other.tokens)
+
+        return Branch(tokens + missing)
 
-    return parser.parse_args()
 
+class NativeBackend(ScoringBackend):
+    """Backend implementing the fit and fit_score primitives in the _xsystem_speedups C extension.
 
-def main() -> int:
-    cmd = parse_arguments()
+    The merge primitives allocate the learnt structures, and are inherited from the reference backend.
+    """
 
-    x = XTructure(
-        cmd.alpha,
-        cmd.max_branch,
-        cmd.branch_threshold
-    )
+    name = "native"
 
-    data_source = open(cmd.input) if cmd.input else sys.stdin
+    def __init__(self) -> None:
+        if _xsystem_speedups is None:
+            raise ValueError("The native backend is not available, the _xsystem_speedups extension is not built")
 
-    for line in data_source:
-        x.learn_new_word(line.strip())
+        ancestors: dict[AsciiClass, frozenset[AsciiClass]] = {}
+
+        for a_class in AsciiClass:
+            chain = [a_class]
+
+            while True:
+                parent = AsciiClass.get_parent(chain[-1])
+                if parent is None:
+                    break
+                chain.append(parent)
+
+            ancestors[a_class] = frozenset(chain)
+
+        _xsystem_speedups.configure(
+            AsciiClass.DIGIT, AsciiClass.LOWER, AsciiClass.UPPER, AsciiClass.ALPHA, AsciiClass.SPACE, AsciiClass.PUNCT,
+            ancestors
+        )
+
+        self.symbol_fit_score = _xsystem_speedups.symbol_fit_score  # type: ignore[method-assign]
+        self.symbol_fit = _xsystem_speedups.symbol_fit  # type: ignore[method-assign]
+        self.token_fit_score = _xsystem_speedups.token_fit_score  # type: ignore[method-assign]
+        self.token_fit = _xsystem_speedups.token_fit  # type: ignore[method-assign]
+        self.branch_fit = _xsystem_speedups.branch_fit  # type: ignore[method-assign]
+
+    def branch_fit_score(self, branch: Branch, t: str, alpha: float) -> float:
+        return _xsystem_speedups.branch_fit_score(branch, NativeBackend._tokens_in_tuple(t), len(t), alpha)
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _tokens_in_tuple(t: str) -> tuple[str, ...]:
+        # The same word is scored against every branch in a row
+        return tuple(Branch.get_tokens_in_tuple(t))
+
+
+def create_backend(name: str) -> ScoringBackend:
+    """Create the backend with the given name, either "python" or "native"."""
+    if name == ScoringBackend.name:
+        return ScoringBackend()
+    if name == NativeBackend.name:
+        return NativeBackend()
+    raise ValueError(f"Unknown backend {name}")
+
+
+def get_backend() -> ScoringBackend:
+    return _backend
+
+
+def set_backend(backend: Union[str, ScoringBackend]) -> None:
+    """Select the backend used by Symbol, Token and Branch, by name or instance."""
+    global _backend
+
+    _backend = create_backend(backend) if isinstance(backend, str) else backend
+
+
+def _default_backend() -> ScoringBackend:
+    """Return the backend named by the XSYSTEM_BACKEND environment variable, or the fastest one available."""
+    name = os.environ.get("XSYSTEM_BACKEND")
+
+    if name:
+        return create_backend(name)
+
+    return NativeBackend() if _xsystem_speedups is not None else ScoringBackend()
+
+
+_backend: ScoringBackend = _default_backend()
+
+
+@dataclass
+class XTructure:
+    alpha: float = 1 / 5
+    max_branches: int = 8
+    branching_threshold: float = 0.85
+    memory_budget: Optional[int] = None
+    canonical: bool = False
+    interned: bool = False
+    branch_slack: float = 0.0
+
+    branches: list[Branch] = field(default_factory=list)
+
+    # Canonical mode only: summary branch of the words learnt so far, by shape, learnt in shape order by flush()
+    _shapes: dict[tuple[tuple[str, ...], ...], Branch] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _stale: bool = field(default=False, init=False, repr=False, compare=False)
+    # Canonical mode only: shape, summary tokens and resulting branches for each shape learnt by the last flush, in
+    # sorted order, so that the next flush resumes from the first summary added or changed since
+    _checkpoints: list[tuple[tuple[tuple[str, ...], ...], list[Token], list[Branch]]] = field(
+        default_factory=list, init=False, repr=False, compare=False
+    )
+
+    # Number of branch merges performed to respect max_branches, for telemetry
+    merges: int = field(default=0, init=False, repr=False, compare=False)
+    # Number of consecutive words learnt without changing the structure, see is_converged()
+    stable_words: int = field(default=0, init=False, repr=False, compare=False)
+
+    # Footprints of the branches, keyed by the identity of their tokens, see _branches_footprint()
+    _footprints: dict[int, tuple[list[Token], int]] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    # Branches staged above max_branches and their reduction, see reduced_branches()
+    _reduced: Optional[tuple[list[list[Token]], list[Branch]]] = field(default=None, init=False, repr=False, compare=False)
+
+    # Distances between branches computed by the last reduction, keyed by the identity of their tokens
+    _fit_cache: dict[tuple[int, int], tuple[list[Token], list[Token], float]] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self) -> None:
+        if self.canonical and self.memory_budget is not None:
+            raise ValueError("A memory budget cannot be enforced in canonical mode, as the shape summaries are unbounded")
+
+    def fit_score(self, t: str) -> float:
+        return min(b.fit_score(t, self.alpha) for b in self.reduced_branches())
+
+    def learn_new_word(self, word: str) -> bool:
+        if len(word) == 0:
+            return False
+
+        changed = True
+
+        if self.canonical:
+            key = XTructure.get_shape(word)
+            summary = self._shapes.get(key)
+
+            if summary is None:
+                self._shapes[key] = Branch.build(word, self.interned)
+            else:
+                tokens = summary.tokens
+                summary.add(word)
+                changed = summary.tokens != tokens
+
+                if not changed:
+                    # Keep the identity of the tokens, so that the checkpoints of flush stay valid
+                    summary.tokens = tokens
+
+            self._stale = self._stale or changed
+
+        elif not len(self.branches):
+            self.branches.append(Branch.build(word, self.interned))
+
+        else:
+            best_branch, score = self._best_branch(word)
+
+            if score < self.branching_threshold:
+                tokens = best_branch.tokens
+                best_branch.add(word)
+                changed = best_branch.tokens != tokens
+
+                if not changed:
+                    # Keep the identity of the tokens, so that their cached footprint and distances stay valid
+                    best_branch.tokens = tokens
+            else:
+                self.branches.append(
+                    Branch.build(word, self.interned)
+                )
+
+            if len(self.branches) > self.branch_capacity():
+                self._reduce_branches()
+
+        # The footprint only grows when the structure changes
+        if self.memory_budget is not None and changed:
+            self._enforce_memory_budget()
+
+        self.stable_words = 0 if changed else self.stable_words + 1
+
+        return True
+
+    def is_converged(self, window: int) -> bool:
+        """Return True if none of the last window words learnt changed the structure.
+
+        A word changes the structure if it creates a branch, extends the characters or the class of a symbol, makes
+        a symbol or a token optional, or triggers a merge or the enforcement of the memory budget.
+        """
+        return self.stable_words >= window
+
+    def flush(self) -> None:
+        """Bring branches up to date with the words learnt so far, in canonical mode."""
+        if self._stale:
+            keys = sorted(self._shapes)
+            checkpoints = self._checkpoints
+            start = 0
+
+            for (key, tokens, _), shape in zip(checkpoints, keys):
+                if key != shape or tokens is not self._shapes[shape].tokens:
+                    break
+
+                start += 1
+
+            del checkpoints[start:]
+            self.branches = list(checkpoints[-1][2]) if checkpoints else []
+
+            for key in keys[start:]:
+                tokens = self._shapes[key].tokens
+                self._add_branches([Branch(list(tokens))])
+                checkpoints.append((key, tokens, list(self.branches)))
+
+            self._stale = False
+
+    def reduced_branches(self) -> list[Branch]:
+        """Return at most max_branches branches, reducing the staged ones on a cached copy."""
+        self.flush()
+
+        if len(self.branches) <= self.max_branches:
+            return self.branches
+
+        tokens = [branch.tokens for branch in self.branches]
+        cached = self._reduced
+
+        if cached is not None and len(cached[0]) == len(tokens) and all(a is b for a, b in zip(cached[0], tokens)):
+            return cached[1]
+
+        # Reducing a copy keeps what is learnt afterwards independent of reading the structure
+        copy = replace(self, branches=list(self.branches))
+        copy._fit_cache = self._fit_cache
+        copy._reduce_branches()
+
+        self._reduced = (tokens, copy.branches)
+
+        return copy.branches
+
+    @staticmethod
+    def get_shape(word: str) -> tuple[tuple[str, ...], ...]:
+        """Return the shape of a word: the ASCII class of every character, grouped by token.
+
+        Words with the same shape build branches with the same structure, whose merge is order insensitive.
+        """
+        return tuple(
+            tuple(AsciiClass.get_ascii_class(c).name for c in token) for token in Branch.get_tokens_in_tuple(word)
+        )
+
+    def footprint(self) -> int:
+        """Approximate size in bytes of the learnt structure.
+
+        The estimate is based on sys.getsizeof of the branches, tokens, symbols and character sets, and it is
+        meant to be summed across many learners to enforce a global budget. In canonical mode it includes the
+        summaries of the shapes.
+        """
+        return self._branches_footprint() + sum(branch.footprint() for branch in self._shapes.values())
+
+    def _branches_footprint(self) -> int:
+        # Branches are never changed in place, only their tokens are replaced, so the footprint of a branch is
+        # recomputed only if its tokens are not the ones measured last time
+        footprints: dict[int, tuple[list[Token], int]] = {}
+        total = 0
+
+        for branch in self.branches:
+            key = id(branch.tokens)
+            cached = self._footprints.get(key)
+
+            if cached is None or cached[0] is not branch.tokens:
+                cached = (branch.tokens, branch.footprint())
+
+            footprints[key] = cached
+            total += cached[1]
+
+        self._footprints = footprints
+
+        return total
+
+    def _enforce_memory_budget(self) -> bool:
+        """Reduce the footprint of the structure until it fits the memory budget.
+
+        Symbols are generalised to their class first, starting from those with the most characters, and branches
+        are merged afterwards. Generalisation is always applied to all the branches, so that the pattern degrades
+        uniformly.
+
+        Returns True if the structure was changed.
+        """
+        assert self.memory_budget is not None
+
+        if self._branches_footprint() <= self.memory_budget:
+            return False
+
+        changed = False
+
+        max_chars = max(
+            (len(symbol.chars) for branch in self.branches for token in branch.tokens for symbol in token.symbols),
+            default=0
+        )
+
+        for min_chars in range(max_chars, 1, -1):
+            if any([branch.generalise(min_chars) for branch in self.branches]):
+                changed = True
+
+                if self._branches_footprint() <= self.memory_budget:
+                    return changed
+
+        while len(self.branches) > 1 and self._branches_footprint() > self.memory_budget:
+            self.branches = self.merge_most_similar()
+            changed = True
+
+        if self._branches_footprint() > self.memory_budget:
+            changed = any([branch.generalise(1) for branch in self.branches]) or changed
+
+        return changed
+
+    def _best_branch(self, word: str) -> tuple[Branch, float]:
+        assert len(self.branches)
+
+        best_score = math.inf
+        best_branch: Optional[Branch] = None
+
+        for branch in self.branches:
+            branch_score = branch.fit_score(word, self.alpha)
+
+            if branch_score < best_score:
+                best_branch = branch
+                best_score = branch_score
+
+        assert best_branch is not None
+        assert best_score != math.inf
+
+        return best_branch, best_score
+
+    def merge_most_similar(self) -> list[Branch]:
+        min_distance = math.inf
+        m_bi: Optional[Branch] = None
+        m_bj: Optional[Branch] = None
+
+        for bi, bj in combinations(self.branches, 2):
+            assert bi is not bj
+
+            distance = bi.fit(bj)
+
+            if distance < min_distance:
+                min_distance = distance
+                m_bi = bi
+                m_bj = bj
+
+        assert m_bi is not None
+        assert m_bj is not None
+
+        self.branches.remove(m_bi)
+        self.branches.remove(m_bj)
+
+        self.branches.append(m_bi.merge(m_bj))
+        self.merges += 1
+
+        return self.branches
+
+    def branch_capacity(self) -> int:
+        """Return the number of branches above which they are reduced to max_branches."""
+        return self.max_branches + math.ceil(self.max_branches * self.branch_slack)
+
+    def _reduce_branches(self) -> None:
+        """Reduce the branches to max_branches, in a single average linkage clustering pass with branch_slack."""
+        if not self.branch_slack:
+            while len(self.branches) > self.max_branches:
+                self.branches = self.merge_most_similar()
+
+            return
+
+        branches = self.branches
+        n = len(branches)
+
+        if n <= self.max_branches:
+            return
+
+        cache: dict[tuple[int, int], tuple[list[Token], list[Token], float]] = {}
+        distances: dict[tuple[int, int], float] = {}
+
+        # The distances of the branches left unchanged since the last pass are reused
+        for i, j in combinations(range(n), 2):
+            tokens_i, tokens_j = branches[i].tokens, branches[j].tokens
+            key = (id(tokens_i), id(tokens_j))
+            cached = self._fit_cache.get(key)
+
+            if cached is not None and cached[0] is tokens_i and cached[1] is tokens_j:
+                distance = cached[2]
+            else:
+                distance = branches[i].fit(branches[j])
+
+            cache[key] = (tokens_i, tokens_j, distance)
+            distances[(i, j)] = distance
+
+        # Clusters are identified by their smallest member, and distances[(a, b)] with a < b is their average linkage
+        clusters: dict[int, list[int]] = {i: [i] for i in range(n)}
+
+        while len(clusters) > self.max_branches:
+            a, b = min(distances, key=lambda pair: (distances[pair], pair))
+
+            size_a, size_b = len(clusters[a]), len(clusters[b])
+            clusters[a].extend(clusters.pop(b))
+
+            for k in clusters:
+                if k == a:
+                    continue
+
+                d_a = distances.pop((min(a, k), max(a, k)))
+                d_b = distances.pop((min(b, k), max(b, k)))
+
+                distances[(min(a, k), max(a, k))] = (size_a * d_a + size_b * d_b) / (size_a + size_b)
+
+            del distances[(a, b)]
+
+        reduced: list[Branch] = []
+
+        for members in clusters.values():
+            merged = branches[members[0]]
+
+            for member in sorted(members[1:]):
+                merged = merged.merge(branches[member])
+
+            reduced.append(merged)
+
+        self.branches = reduced
+        self.merges += n - len(reduced)
+        self._fit_cache = {
+            key: value for key, value in cache.items()
+            if any(value[0] is branch.tokens for branch in reduced) and any(value[1] is branch.tokens for branch in reduced)
+        }
+
+    def spawn(self) -> XTructure:
+        """Return an empty structure with the same learning parameters."""
+        return replace(self, branches=[])
+
+    def update(self, other: XTructure) -> None:
+        """Merge into this structure the branches learnt by other.
+
+        Each branch of other is merged into the closest branch of this structure if their distance is below the
+        branching threshold, and it is appended otherwise. The most similar branches are then merged until
+        max_branches is respected.
+
+        In canonical mode the shape summaries are merged instead, and other has to be in canonical mode too.
+        """
+        self.merges += other.merges
+
+        if other.branches or other._shapes:
+            self.stable_words = 0
+
+        if self.canonical:
+            if not other.canonical:
+                raise ValueError("Cannot update a canonical structure with a non canonical one")
+
+            for key, branch in other._shapes.items():
+                summary = self._shapes.get(key)
+                self._shapes[key] = Branch(list(branch.tokens)) if summary is None else summary.merge(branch)
+
+            self._stale = self._stale or bool(other._shapes)
+
+            return
+
+        self._add_branches(other.reduced_branches())
+
+    def _add_branches(self, new_branches: Iterable[Branch]) -> None:
+        branches = list(self.branches)
+
+        for branch in new_branches:
+            best_index, best_distance = -1, math.inf
+
+            for i, candidate in enumerate(branches):
+                distance = candidate.fit(branch)
+
+                if distance < best_distance:
+                    best_index, best_distance = i, distance
+
+            if best_distance < self.branching_threshold:
+                branches[best_index] = branches[best_index].merge(branch)
+                continue
+
+            branches.append(branch)
+
+            # Reduce as new branches arrive, as learn_new_word does, so that a reduction never has to cluster more
+            # than branch_capacity() + 1 branches
+            if len(branches) > self.branch_capacity():
+                self.branches = branches
+                self._reduce_branches()
+                branches = list(self.branches)
+
+        self.branches = branches
+
+        if self.memory_budget is not None:
+            self._enforce_memory_budget()
+
+    def learn_threaded(self, words: Iterable[str], workers: int = 4, chunk_size: int = 1024) -> None:
+        """Learn the words using a pool of threads.
+
+        The words are split in chunks of chunk_size, each learnt by an independent sub-learner created by spawn(),
+        and the sub-learners are merged into this structure in input order by the calling thread. No structure is
+        shared between threads, and the result only depends on chunk_size, not on the number of workers or on
+        the scheduling of the threads. In canonical mode it does not depend on chunk_size either.
+
+        At most 2 * workers chunks are in flight, so the input is consumed lazily.
+        """
+        if workers < 1:
+            raise ValueError(f"Expected at least one worker, got {workers}")
+
+        pending: deque[Future[XTructure]] = deque()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for chunk in _chunks(words, chunk_size):
+                pending.append(executor.submit(self._learn_chunk, chunk))
+
+                if len(pending) >= 2 * workers:
+                    self.update(pending.popleft().result())
+
+            while pending:
+                self.update(pending.popleft().result())
+
+    def _learn_chunk(self, words: list[str]) -> XTructure:
+        learner = self.spawn()
+
+        for word in words:
+            learner.learn_new_word(word)
+
+        return learner
+
+    def __str__(self) -> str:
+        return "|".join(str(branch) for branch in self.reduced_branches())
+
+    def to_regex(self) -> str:
+        """Return an optimised, anchored pattern equivalent to the learnt structure.
+
+        Unlike __str__, the pattern uses classes supported by the re module, sorted character sets with ranges,
+        quantifiers and non capturing groups, and the common prefixes of the branches are factored.
+        """
+        trie = _PatternTrie()
+
+        for branch in self.reduced_branches():
+            trie.add([token.to_regex() for token in branch.tokens])
+
+        return "^" + trie.to_regex() + "$"
+
+
+class _PatternTrie:
+    """Trie of the token patterns of the branches, used to factor their common prefixes."""
+
+    def __init__(self) -> None:
+        self.children: dict[str, _PatternTrie] = {}
+        self.is_end = False
+
+    def add(self, parts: Sequence[str]) -> None:
+        node = self
+
+        for part in parts:
+            node = node.children.setdefault(part, _PatternTrie())
+
+        node.is_end = True
+
+    def to_regex(self) -> str:
+        alternatives = [part + child.to_regex() for part, child in self.children.items()]
+
+        if not alternatives:
+            return ""
+
+        if self.is_end:
+            return "(?:" + "|".join(alternatives) + ")?"
+
+        if len(alternatives) == 1:
+            return alternatives[0]
+
+        return "(?:" + "|".join(alternatives) + ")"
+
+
+def _chunks(words: Iterable[str], size: int) -> Iterator[list[str]]:
+    if size < 1:
+        raise ValueError(f"Expected a positive chunk size, got {size}")
+
+    iterator = iter(words)
+
+    while True:
+        chunk = list(islice(iterator, size))
+
+        if not chunk:
+            return
+
+        yield chunk
+
+
+@lru_cache(maxsize=None)
+def _non_decimal_digits() -> str:
+    return Symbol._ranges([c for c in map(chr, range(sys.maxunicode + 1)) if c.isdigit() and not c.isdecimal()])
+
+
+# Code of each class in a pattern store, in declaration order
+_CLASS_CODES = {a_class: code for code, a_class in enumerate(AsciiClass)}
+
+
+@lru_cache(maxsize=4096)
+def _char_class_code(c: str) -> int:
+    return _CLASS_CODES[AsciiClass.get_ascii_class(c)]
+
+
+class PatternStore:
+    """Flat, read-only encoding of learned structures, scored and matched in place through a memory map."""
+
+    MAGIC = b"XSPS"
+    VERSION = 1
+
+    # The arrays are written in the byte order of the writing machine
+    _BYTE_ORDER_MARK = 0x01020304
+
+    # Section name and array type code, in file order
+    _SECTIONS: tuple[tuple[str, Literal["B", "I"]], ...] = (
+        ("structures", "B"),  # _RECORD for each structure, sorted by name
+        ("branches", "I"),  # first token, number of tokens
+        ("tokens", "I"),  # first symbol, number of symbols, optional
+        ("symbol_classes", "B"),
+        ("symbol_flags", "B"),
+        ("symbol_bitmaps", "I"),
+        ("symbol_extras", "I"),  # first code point, number of code points
+        ("bitmaps", "B"),  # 16 bytes for each distinct ASCII character set
+        ("extras", "I"),
+        ("strings", "B"),
+    )
+
+    _HEADER = struct.Struct("=4sIII" + "QQ" * len(_SECTIONS))
+    # Name offset and length, pattern offset and length, first branch, number of branches, alpha
+    _RECORD = struct.Struct("=IIIIIId")
+
+    IS_CLASS = 1
+    IS_OPTIONAL = 2
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._buffer = memoryview(self._mmap)
+
+        magic, byte_order_mark, version, self._size, *sections = PatternStore._HEADER.unpack_from(self._buffer)
+
+        if magic != PatternStore.MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a pattern store")
+        if byte_order_mark != PatternStore._BYTE_ORDER_MARK:
+            self.close()
+            raise ValueError(f"{path} was written with another byte order")
+        if version != PatternStore.VERSION:
+            self.close()
+            raise ValueError(f"Unsupported pattern store version {version}")
+
+        self._views: dict[str, memoryview] = {}
+
+        for (name, typecode), offset, length in zip(PatternStore._SECTIONS, sections[::2], sections[1::2]):
+            self._views[name] = self._buffer[offset:offset + length].cast(typecode)
+
+        self.structures = self._views["structures"]
+        self.branches = self._views["branches"]
+        self.tokens = self._views["tokens"]
+        self.symbol_classes = self._views["symbol_classes"]
+        self.symbol_flags = self._views["symbol_flags"]
+        self.symbol_bitmaps = self._views["symbol_bitmaps"]
+        self.symbol_extras = self._views["symbol_extras"]
+        self.bitmaps = self._views["bitmaps"]
+        self.extras = self._views["extras"]
+        self.strings = self._views["strings"]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._name(i) for i in range(self._size))
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and self._find(name) is not None
+
+    def __getitem__(self, name: str) -> MappedXTructure:
+        index = self._find(name)
+
+        if index is None:
+            raise KeyError(name)
+
+        return MappedXTructure(self, index)
+
+    def __enter__(self) -> PatternStore:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for view in getattr(self, "_views", {}).values():
+            view.release()
+
+        self._buffer.release()
+        self._mmap.close()
+
+    def record(self, index: int) -> tuple[int, int, int, int, int, int, float]:
+        return PatternStore._RECORD.unpack_from(self.structures, index * PatternStore._RECORD.size)
+
+    def string(self, offset: int, length: int) -> str:
+        return bytes(self.strings[offset:offset + length]).decode("utf-8")
+
+    def has_char(self, symbol: int, c: str) -> bool:
+        o = ord(c)
+
+        if o < 128:
+            return bool(self.bitmaps[16 * self.symbol_bitmaps[symbol] + (o >> 3)] >> (o & 7) & 1)
+
+        first, count = self.symbol_extras[2 * symbol], self.symbol_extras[2 * symbol + 1]
+        i = bisect_left(self.extras, o, first, first + count)
+
+        return i < first + count and self.extras[i] == o
+
+    def _name(self, index: int) -> str:
+        name_offset, name_length, *_ = self.record(index)
+        return self.string(name_offset, name_length)
+
+    def _find(self, name: str) -> Optional[int]:
+        # Records are sorted by the UTF-8 encoding of the names
+        key = name.encode("utf-8")
+        low, high = 0, self._size
+
+        while low < high:
+            middle = (low + high) // 2
+            name_offset, name_length, *_ = self.record(middle)
+
+            if bytes(self.strings[name_offset:name_offset + name_length]) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self._size and self._name(low) == name:
+            return low
+
+        return None
+
+    @staticmethod
+    def write(path: str, structures: dict[str, XTructure]) -> None:
+        """Write the structures, by name, to a pattern store at path."""
+        sections: dict[str, array[int]] = {name: array(typecode) for name, typecode in PatternStore._SECTIONS}
+        bitmap_indices: dict[bytes, int] = {}
+
+        for name in sorted(structures, key=lambda n: n.encode("utf-8")):
+            x = structures[name]
+            pattern = x.to_regex()
+            branches = x.reduced_branches()
+
+            encoded_name = name.encode("utf-8")
+            encoded_pattern = pattern.encode("utf-8")
+            strings = sections["strings"]
+
+            sections["structures"].frombytes(PatternStore._RECORD.pack(
+                len(strings), len(encoded_name),
+                len(strings) + len(encoded_name), len(encoded_pattern),
+                len(sections["branches"]) // 2, len(branches),
+                x.alpha
+            ))
+            strings.frombytes(encoded_name + encoded_pattern)
+
+            for branch in branches:
+                sections["branches"].extend((len(sections["tokens"]) // 3, len(branch.tokens)))
+
+                for token in branch.tokens:
+                    sections["tokens"].extend((len(sections["symbol_classes"]), len(token.symbols), token.optional))
+
+                    for symbol in token.symbols:
+                        PatternStore._add_symbol(sections, bitmap_indices, symbol)
+
+        data = bytearray(PatternStore._HEADER.size)
+        positions: list[int] = []
+
+        for name, _ in PatternStore._SECTIONS:
+            data.extend(bytes(-len(data) % 8))
+            positions.extend((len(data), len(sections[name]) * sections[name].itemsize))
+            data.extend(sections[name].tobytes())
+
+        PatternStore._HEADER.pack_into(
+            data, 0, PatternStore.MAGIC, PatternStore._BYTE_ORDER_MARK, PatternStore.VERSION, len(structures),
+            *positions
+        )
+
+        with open(path, "wb") as f:
+            f.write(data)
+
+    @staticmethod
+    def _add_symbol(sections: dict[str, array[int]], bitmap_indices: dict[bytes, int], symbol: Symbol) -> None:
+        bitmap = bytearray(16)
+        extras = []
+
+        for c in symbol.chars:
+            o = ord(c)
+
+            if o < 128:
+                bitmap[o >> 3] |= 1 << (o & 7)
+            else:
+                extras.append(o)
+
+        # Symbols share the bitmaps of equal ASCII character sets
+        key = bytes(bitmap)
+
+        if key not in bitmap_indices:
+            bitmap_indices[key] = len(bitmap_indices)
+            sections["bitmaps"].frombytes(key)
+
+        sections["symbol_classes"].append(_CLASS_CODES[symbol.a_class])
+        sections["symbol_flags"].append(
+            (PatternStore.IS_CLASS if symbol.is_class else 0) | (PatternStore.IS_OPTIONAL if symbol.is_optional else 0)
+        )
+        sections["symbol_bitmaps"].append(bitmap_indices[key])
+        sections["symbol_extras"].extend((len(sections["extras"]), len(extras)))
+        sections["extras"].extend(sorted(extras))
+
+
+class MappedXTructure:
+    """Read-only view of a structure in a PatternStore, scoring words as XTructure.fit_score() does."""
+
+    def __init__(self, store: PatternStore, index: int) -> None:
+        self.store = store
+        name_offset, name_length, pattern_offset, pattern_length, first_branch, branches, alpha = store.record(index)
+
+        self.name = store.string(name_offset, name_length)
+        self.alpha = alpha
+        self._pattern = (pattern_offset, pattern_length)
+        self._branches = range(first_branch, first_branch + branches)
+        self._compiled: Optional[Pattern[str]] = None
+
+    def fit_score(self, t: str) -> float:
+        # As in Branch.fit_score, only as many tokens of the word as it has characters are scored
+        tuple_tokens = list(islice(Branch.get_tokens_in_tuple(t), len(t)))
+
+        return min(self._branch_fit_score(b, tuple_tokens) for b in self._branches)
+
+    def to_regex(self) -> str:
+        return self.store.string(*self._pattern)
+
+    def match(self, t: str) -> Optional[Match[str]]:
+        # The stored pattern is compiled on first use in each process
+        if self._compiled is None:
+            self._compiled = re.compile(self.to_regex())
+
+        return self._compiled.match(t)
+
+    def _branch_fit_score(self, b: int, tuple_tokens: list[str]) -> float:
+        first_token, tokens = self.store.branches[2 * b], self.store.branches[2 * b + 1]
+        score: float = 0
+
+        # Tokens of the word past those of the branch score their length
+        for i, t_i in enumerate(tuple_tokens):
+            score += self._token_fit_score(first_token + i, t_i) if i < tokens else len(t_i)
+
+        return score
+
+    def _token_fit_score(self, token: int, t: str) -> float:
+        store = self.store
+        first_symbol, symbols = store.tokens[3 * token], store.tokens[3 * token + 1]
+        score: float = 0
+
+        for symbol, c in zip(range(first_symbol, first_symbol + symbols), t):
+            if _char_class_code(c) == store.symbol_classes[symbol]:
+                score += 0
+            elif not store.symbol_flags[symbol] & PatternStore.IS_CLASS and store.has_char(symbol, c):
+                score += self.alpha
+            else:
+                score += 1
+
+        return score + abs(len(t) - symbols)
+
+
+def current_rss() -> Optional[int]:
+    """Return the resident set size of the process in bytes, if available.
+
+    On Linux the current value is read from /proc, elsewhere the peak value reported by getrusage is used.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class ProgressReporter:
+    """Periodic report of the progress of a learning run.
+
+    The learning loop compares the number of rows processed with next_report, and calls report() only when it is
+    reached, so that the clock is read once per report and not once per row. Reports are written to output as
+    human readable lines, or as JSON lines if json_lines is set.
+    """
+
+    def __init__(
+            self,
+            output: TextIO,
+            every: Optional[int] = None,
+            pattern_every: Optional[int] = None,
+            json_lines: bool = False) -> None:
+        if every is not None and every < 1:
+            raise ValueError(f"Expected a positive reporting interval, got {every}")
+        if pattern_every is not None and pattern_every < 1:
+            raise ValueError(f"Expected a positive pattern interval, got {pattern_every}")
+
+        self.output = output
+        self.every = every
+        self.pattern_every = pattern_every
+        self.json_lines = json_lines
+
+        self.start = time.monotonic()
+        self.next_report = self._next(0)
+        self.last_report: Optional[int] = None
+
+    def _next(self, rows: int) -> float:
+        return min(
+            (rows - rows % interval + interval for interval in (self.every, self.pattern_every) if interval is not None),
+            default=math.inf
+        )
+
+    def report(self, rows: int, x: XTructure, final: bool = False) -> None:
+        """Report the progress after rows rows. The final report is skipped if rows were already reported.
+
+        Reports do not flush x, so that they are cheap and do not change what is learnt: branches counts the branches
+        as they are, including the staged ones, and in canonical mode the number of shapes is reported as well, as
+        branches are only built when the pattern is reported.
+        """
+        if final and rows == self.last_report:
+            return
+
+        elapsed = time.monotonic() - self.start
+        with_pattern = self.pattern_every is not None and (final or rows % self.pattern_every == 0)
+
+        metrics: dict[str, object] = {
+            "rows": rows,
+            "elapsed": round(elapsed, 3),
+            "rows_per_sec": round(rows / elapsed, 1) if elapsed > 0 else None,
+            "branches": len(x.branches),
+            "merges": x.merges,
+            "rss": current_rss(),
+        }
+
+        if x.canonical:
+            metrics["shapes"] = len(x._shapes)
+
+        if with_pattern:
+            metrics["pattern"] = str(x)
+
+        if self.json_lines:
+            print(json.dumps(metrics), file=self.output, flush=True)
+        else:
+            print(" ".join(f"{key}={value}" for key, value in metrics.items()), file=self.output, flush=True)
+
+        self.next_report = self._next(rows)
+        self.last_report = rows
+
+
+def learn(
+        x: XTructure,
+        lines: Iterable[str],
+        reporter: Optional[ProgressReporter] = None,
+        stop_when_stable: Optional[int] = None) -> int:
+    """Learn the stripped lines, reporting the progress if a reporter is given. Returns the number of rows.
+
+    If stop_when_stable is given, learning stops as soon as x.is_converged(stop_when_stable), and the remaining lines
+    are left in the iterator.
+    """
+    if stop_when_stable is not None and stop_when_stable < 1:
+        raise ValueError(f"Expected a positive stability window, got {stop_when_stable}")
+
+    rows = 0
+
+    if reporter is None and stop_when_stable is None:
+        for rows, line in enumerate(lines, 1):
+            x.learn_new_word(line.strip())
+
+        return rows
+
+    next_report = reporter.next_report if reporter is not None else math.inf
+    window = stop_when_stable if stop_when_stable is not None else math.inf
+
+    for rows, line in enumerate(lines, 1):
+        x.learn_new_word(line.strip())
+
+        if rows >= next_report:
+            assert reporter is not None
+            reporter.report(rows, x)
+            next_report = reporter.next_report
+
+        if x.stable_words >= window:
+            break
+
+    if reporter is not None:
+        reporter.report(rows, x, final=True)
+
+    return rows
+
+
+def validate(x: XTructure, lines: Iterable[str]) -> tuple[int, int]:
+    """Match the stripped lines with the optimised pattern of x, and learn the ones that do not match.
+
+    Returns the number of rows and of mismatches.
+    """
+    pattern = re.compile(x.to_regex())
+
+    rows = 0
+    mismatches = 0
+
+    for rows, line in enumerate(lines, 1):
+        word = line.strip()
+
+        if word and not pattern.match(word):
+            x.learn_new_word(word)
+            mismatches += 1
+
+    return rows, mismatches
+
+
+def is_glob(source: str) -> bool:
+    return any(c in source for c in "*?[")
+
+
+def input_files(source: str) -> list[str]:
+    """Return the files to learn from: the files in a directory, the files matching a glob pattern, or a file."""
+    if os.path.isdir(source):
+        return sorted(
+            entry.path for entry in os.scandir(source) if entry.is_file()
+        )
+
+    if is_glob(source):
+        return sorted(path for path in glob.glob(source, recursive=True) if os.path.isfile(path))
+
+    return [source]
+
+
+def plan_chunks(paths: Iterable[str], chunk_size: int) -> list[tuple[str, int, int]]:
+    """Split the files in byte ranges of at most chunk_size bytes, in input order.
+
+    Ranges are not aligned on line boundaries: read_chunk() assigns each line to the range containing its first byte.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"Expected a positive chunk size, got {chunk_size}")
+
+    return [
+        (path, start, min(start + chunk_size, size))
+        for path in paths
+        for size in (os.path.getsize(path),)
+        for start in range(0, size, chunk_size)
+    ]
+
+
+def read_chunk(path: str, start: int, end: int) -> Generator[str, None, None]:
+    """Yield the lines of the file whose first byte is in [start, end)."""
+    with open(path, "rb") as data_source:
+        if start > 0:
+            # The line containing the byte before start, if any, belongs to the previous chunk
+            data_source.seek(start - 1)
+            data_source.readline()
+
+        position = data_source.tell()
+
+        while position < end:
+            line = data_source.readline()
+
+            if not line:
+                return
+
+            position += len(line)
+
+            yield line.decode("utf-8", errors="replace")
+
+
+def _learn_file_chunk(
+        template: XTructure,
+        path: str,
+        start: int,
+        end: int,
+        stop_when_stable: Optional[int] = None) -> tuple[XTructure, int]:
+    x = template.spawn()
+
+    rows = learn(x, read_chunk(path, start, end), stop_when_stable=stop_when_stable)
+
+    return x, rows
+
+
+def learn_files(
+        x: XTructure,
+        paths: Iterable[str],
+        processes: Optional[int] = None,
+        chunk_size: int = 16 * 1024 * 1024,
+        reporter: Optional[ProgressReporter] = None,
+        stop_when_stable: Optional[int] = None) -> int:
+    """Learn the chunks of the files in a pool of processes, merged into x in input order. Returns the number of rows."""
+    chunks = plan_chunks(paths, chunk_size)
+    rows = 0
+
+    partials: dict[int, tuple[XTructure, int]] = {}
+    next_chunk = 0
+
+    def reduce_ready() -> None:
+        nonlocal next_chunk, rows
+
+        while next_chunk in partials:
+            partial, partial_rows = partials.pop(next_chunk)
+            x.update(partial)
+            rows += partial_rows
+            next_chunk += 1
+
+            if reporter is not None and rows >= reporter.next_report:
+                reporter.report(rows, x)
+
+    # Largest chunks first, to limit the tail of the run, and stop_when_stable applies to each chunk on its own
+    if processes == 1:
+        for i, chunk in enumerate(chunks):
+            partials[i] = _learn_file_chunk(x.spawn(), *chunk, stop_when_stable)
+            reduce_ready()
+    elif chunks:
+        order = sorted(range(len(chunks)), key=lambda i: chunks[i][1] - chunks[i][2])
+
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = {executor.submit(_learn_file_chunk, x.spawn(), *chunks[i], stop_when_stable): i for i in order}
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    partials[futures.pop(future)] = future.result()
+
+                reduce_ready()
+
+    if reporter is not None:
+        reporter.report(rows, x, final=True)
+
+    return rows
+
+
+def parse_arguments(args: Optional[Sequence[str]] = None) -> Namespace:
+    parser = ArgumentParser(
+        prog=sys.argv[0].split("/")[-1],
+        description="A simple tool to learn human readable a regular expression from examples",
+    )
+
+    parser.add_argument("-i", "--input", help="Path to the input source, a file, a directory or a glob pattern, defaults to stdin")
+    parser.add_argument("-o", "--output", help="Path to the output file, defaults to stdout")
+    parser.add_argument("--max-branch", type=int, default=8, help="Maximum number of branches allowed, defaults to 8")
+    parser.add_argument("--alpha", type=float, default=1 / 5, help="Weight for fitting tuples, defaults to 1/5")
+    parser.add_argument("--branch-threshold", type=float, default=.85, help="Branching threshold, defaults to 0.85, relative to the fitting score alpha")
+    parser.add_argument("--branch-slack", type=float, default=0.0, help="Fraction of max branches that can be staged before reducing them in a single clustering pass, defaults to 0")
+    parser.add_argument("--memory-budget", type=int, default=None, help="Approximate maximum size in bytes of the learnt structure, unbounded by default, not supported with --canonical")
+    parser.add_argument("--canonical", action="store_true", help="Learn a pattern that does not depend on the order of the input")
+    parser.add_argument("--interned", action="store_true", help="Share identical symbols and tokens and cache their merges")
+    parser.add_argument("--optimize", action="store_true", help="Output an optimised, anchored pattern using only syntax supported by the re module")
+    parser.add_argument("--processes", type=int, default=None, help="Number of worker processes for directory and glob inputs, defaults to the number of CPUs")
+    parser.add_argument("--chunk-size", type=int, default=16 * 1024 * 1024, help="Size in bytes of the chunks of the input files learnt by the worker processes, defaults to 16MiB")
+    parser.add_argument("--stop-when-stable", type=int, default=None, metavar="N", help="Stop reading the input when the last N rows did not change the pattern, not supported with directory and glob inputs or --processes")
+    parser.add_argument("--validate", type=int, default=0, metavar="N", help="With --stop-when-stable, match the next N rows with the pattern and learn the ones not matching, not supported with directory and glob inputs or --processes")
+    parser.add_argument("--progress", type=int, default=None, metavar="N", help="Report rows, throughput, branches, merges and RSS every N rows")
+    parser.add_argument("--print-pattern-every", type=int, default=None, metavar="N", help="Report the intermediate pattern every N rows")
+    parser.add_argument("--metrics", help="Path to a JSON lines file for the progress reports, defaults to human readable lines on stderr")
+
+    cmd = parser.parse_args(args)
+
+    if cmd.canonical and cmd.memory_budget is not None:
+        parser.error("--memory-budget cannot be combined with --canonical")
+
+    if cmd.stop_when_stable is not None and cmd.stop_when_stable < 1:
+        parser.error("--stop-when-stable must be at least 1")
+
+    if cmd.validate < 0:
+        parser.error("--validate cannot be negative")
+
+    if cmd.validate > 0 and cmd.stop_when_stable is None:
+        parser.error("--validate requires --stop-when-stable")
+
+    # Worker processes learn chunks independently, so the input as a whole never converges
+    if _learns_in_processes(cmd) and (cmd.stop_when_stable is not None or cmd.validate > 0):
+        parser.error("--stop-when-stable and --validate cannot be combined with directory and glob inputs or --processes")
+
+    return cmd
+
+
+def _learns_in_processes(cmd: Namespace) -> bool:
+    return bool(cmd.input) and (cmd.processes is not None or os.path.isdir(cmd.input) or is_glob(cmd.input))
+
+
+def main(args: Optional[Sequence[str]] = None) -> int:
+    cmd = parse_arguments(args)
+
+    x = XTructure(
+        cmd.alpha,
+        cmd.max_branch,
+        cmd.branch_threshold,
+        cmd.memory_budget,
+        cmd.canonical,
+        cmd.interned,
+        cmd.branch_slack
+    )
+
+    reporter: Optional[ProgressReporter] = None
+
+    if cmd.progress is not None or cmd.print_pattern_every is not None or cmd.metrics:
+        reporter = ProgressReporter(
+            open(cmd.metrics, "w") if cmd.metrics else sys.stderr,
+            cmd.progress,
+            cmd.print_pattern_every,
+            json_lines=bool(cmd.metrics)
+        )
+
+    if _learns_in_processes(cmd):
+        learn_files(x, input_files(cmd.input), cmd.processes, cmd.chunk_size, reporter)
+    else:
+        data_source = open(cmd.input) if cmd.input else sys.stdin
+
+        learn(x, data_source, reporter, cmd.stop_when_stable)
+
+        if cmd.validate > 0:
+            rows, mismatches = validate(x, islice(data_source, cmd.validate))
+
+            print(f"validated={rows} mismatches={mismatches}", file=sys.stderr)
+
+    if reporter is not None and reporter.output is not sys.stderr:
+        reporter.output.close()
 
-    output = open(cmd.output) if cmd.output else sys.stdout
+    output = open(cmd.output, "w") if cmd.output else sys.stdout
 
-    print(str(x), file=output)
+    print(x.to_regex() if cmd.optimize else str(x), file=output)
 
     return 0
 